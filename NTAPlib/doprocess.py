@@ -26,11 +26,17 @@
 ###########################################################################
 import os
 import subprocess
-import pwd
-import grp
 import userio
+import tracing
+import profiler
 import signal
 import sys
+import time
+import errno
+import select
+import collections
+
+pollinterval = 0.05
 
 
 def isroot():
@@ -49,39 +55,32 @@ def signal2exit(signum, frame):
     sys.exit(0)
 
 
-def doprocess(command, **kwargs):
+def processsetup(command, **kwargs):
     passkwargs = {'bufsize': 1,
                   'stdin': subprocess.PIPE,
                   'stdout': subprocess.PIPE,
                   'stderr': subprocess.PIPE,
-                  'shell': False}
-    OAmmandblock = ''
+                  'shell': False,
+                  'close_fds': True}
     cmdargs = []
     printstdout = False
-    retryable = False
-    showchange = False
-    tryagain = True
     stdin = None
-    trapsignals = False
-    noparse = False
-    returndict = {}
     mypath = "/bin:/usr/bin:/usr/local/bin"
+    if 'NTAP_PATH' in os.environ.keys():
+        mypath = os.environ['NTAP_PATH'] + ":" + mypath
     myldlibrarypath = "/lib"
     myenv = {"PATH": mypath, "LD_LIBRARY_PATH": myldlibrarypath}
     mylist = command.split(' ')
-    debug = False
     for item in mylist:
         cmdargs.append(item)
-    if 'debug' in kwargs.keys():
-        debug = kwargs['debug']
-    if 'noparse' in kwargs.keys():
-        noparse = kwargs['noparse']
     if 'env' in kwargs.keys():
         for key in kwargs['env'].keys():
             if key in myenv.keys():
                 myenv[key] = myenv[key]+":"+kwargs['env'][key]
             else:
                 myenv[key] = kwargs['env'][key]
+    myenv.update(tracing.childenv())
+    myenv.update(profiler.childenv())
     passkwargs['env'] = myenv
     if 'user' in kwargs.keys():
         useraccount = kwargs['user']
@@ -91,8 +90,6 @@ def doprocess(command, **kwargs):
             passkwargs['preexec_fn'] = changeuser(useraccount, showchange=False)
     if 'printstdout' in kwargs.keys():
         printstdout = kwargs['printstdout']
-    if 'retry' in kwargs.keys():
-        retryable = kwargs['retry']
     if 'input' in kwargs.keys():
         if type(kwargs['input']) is str:
             stdin = kwargs['input']
@@ -105,9 +102,35 @@ def doprocess(command, **kwargs):
                     stdin = stdin + "\n"
     if 'cwd' in kwargs.keys():
         passkwargs['cwd'] = kwargs['cwd']
+
+    streamkwargs = {'keeplines': None, 'timeout': None, 'noparse': False,
+                    'stdoutcallback': None, 'stderrcallback': None}
+    for key in streamkwargs.keys():
+        if key in kwargs.keys():
+            streamkwargs[key] = kwargs[key]
+    if 'stdoutcallback' not in kwargs.keys() and printstdout:
+        streamkwargs['stdoutcallback'] = printline
+    streamkwargs['command'] = command
+    streamkwargs['user'] = kwargs.get('user')
+
+    return({'ARGS': cmdargs, 'POPEN': passkwargs, 'INPUT': stdin, 'STREAM': streamkwargs})
+
+
+def doprocess(command, **kwargs):
+    retryable = False
+    tryagain = True
+    returndict = {}
+    debug = False
+    if 'debug' in kwargs.keys():
+        debug = kwargs['debug']
+    if 'retry' in kwargs.keys():
+        retryable = kwargs['retry']
     if 'trapsignals' in kwargs.keys():
         signal.signal(signal.SIGINT, signal2exit)
+    setup = processsetup(command, **kwargs)
 
+    returndict['STOPPED'] = False
+    returndict['TIMEDOUT'] = False
     while tryagain:
         tryagain = False
         stdout = []
@@ -115,44 +138,19 @@ def doprocess(command, **kwargs):
         resultcode = None
 
         try:
-            cmd = subprocess.Popen(cmdargs, **passkwargs)
+            cmd = subprocess.Popen(setup['ARGS'], **setup['POPEN'])
         except Exception:
             resultcode = 1
+            profiler.recordprocess(command, user=kwargs.get('user'), result=1)
 
         if resultcode is None:
-            if printstdout:
-                if stdin is not None:
-                    cmd.stdin.write(stdin)
-                while cmd.poll() is None:
-                    nextline = cmd.stdout.readline().rstrip()
-                    if len(nextline) > 0:
-                        userio.message(nextline)
-                        stdout.append(nextline)
-                remainder = cmd.stdout.readlines()
-                for nextline in remainder:
-                    if len(nextline) > 0:
-                        userio.message(nextline)
-                        stdout.append(nextline)
-                stderr = cmd.stderr.readlines()
-            else:
-                if stdin is not None:
-                    cmdout, cmderr = cmd.communicate(stdin)
-                else:
-                    cmdout, cmderr = cmd.communicate()
-                if noparse:
-                    stdout = cmdout
-                    stderr = cmderr
-                else:
-                    lines = cmdout.splitlines()
-                    for line in lines:
-                        if len(line) > 0:
-                            stdout.append(line)
-                    lines = cmderr.splitlines()
-                    for line in lines:
-                        if len(line) > 0:
-                            stderr.append(line)
-
-            resultcode = cmd.returncode
+            out = streamprocess(cmd, setup['INPUT'], **setup['STREAM'])
+            stdout = out['STDOUT']
+            stderr = out['STDERR']
+            resultcode = out['RESULT']
+            returndict['STOPPED'] = out['STOPPED']
+            returndict['TIMEDOUT'] = out['TIMEDOUT']
+        tracing.recordprocess(command, resultcode)
 
         if retryable and resultcode > 0:
             userio.warn("Errors encountered during '" + command + "'")
@@ -174,19 +172,231 @@ def doprocess(command, **kwargs):
     return(returndict)
 
 
+def doprocesses(commands, **kwargs):
+    if 'limit' in kwargs.keys():
+        limit = kwargs['limit']
+    else:
+        limit = 8
+    results = [None] * len(commands)
+    waiting = range(0, len(commands))
+    running = {}
+
+    while len(waiting) > 0 or len(running) > 0:
+        while len(waiting) > 0 and len(running) < limit:
+            index = waiting.pop(0)
+            if type(commands[index]) is str:
+                command, cmdkwargs = commands[index], {}
+            else:
+                command, cmdkwargs = commands[index]
+            setup = processsetup(command, **cmdkwargs)
+            try:
+                cmd = subprocess.Popen(setup['ARGS'], **setup['POPEN'])
+            except Exception:
+                results[index] = {'RESULT': 1, 'STDOUT': [], 'STDERR': [], 'STOPPED': False, 'TIMEDOUT': False}
+                tracing.recordprocess(command, 1)
+                profiler.recordprocess(command, user=cmdkwargs.get('user'), result=1)
+                continue
+            running[index] = ProcessStream(cmd, setup['INPUT'], **setup['STREAM'])
+
+        readfds = {}
+        writefds = {}
+        remaining = None
+        for index in running.keys():
+            stream = running[index]
+            for fd in stream.readfds:
+                readfds[fd] = stream
+            if stream.writefd() is not None:
+                writefds[stream.writefd()] = stream
+            waittime = stream.waittime(time.time())
+            if waittime is not None and (remaining is None or waittime < remaining):
+                remaining = waittime
+
+        if len(readfds) > 0 or len(writefds) > 0:
+            try:
+                readable, writable = select.select(readfds.keys(), writefds.keys(), [], remaining)[:2]
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fd in writable:
+                writefds[fd].write()
+            for fd in readable:
+                readfds[fd].read(fd)
+        elif remaining is not None:
+            time.sleep(remaining)
+
+        now = time.time()
+        for index in running.keys():
+            if running[index].done(now):
+                results[index] = running[index].finish()
+                if type(commands[index]) is str:
+                    tracing.recordprocess(commands[index], results[index]['RESULT'])
+                else:
+                    tracing.recordprocess(commands[index][0], results[index]['RESULT'])
+                del running[index]
+
+    return(results)
+
+
+def printline(line):
+    userio.message(line)
+
+
+def streamprocess(cmd, stdin, **kwargs):
+    stream = ProcessStream(cmd, stdin, **kwargs)
+    while not stream.done(time.time()):
+        remaining = stream.waittime(time.time())
+        if stream.writefd() is not None:
+            writefds = [stream.writefd()]
+        else:
+            writefds = []
+        try:
+            readable, writable = select.select(stream.readfds, writefds, [], remaining)[:2]
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                continue
+            raise
+        if len(writable) > 0:
+            stream.write()
+        for fd in readable:
+            stream.read(fd)
+    return(stream.finish())
+
+
+class ProcessStream(object):
+    def __init__(self, cmd, stdin, **kwargs):
+        self.cmd = cmd
+        self.command = kwargs.get('command')
+        self.user = kwargs.get('user')
+        self.started = time.time()
+        self.bytesin = 0
+        self.bytesout = 0
+        self.noparse = kwargs.get('noparse', False)
+        self.timeout = kwargs.get('timeout')
+        keeplines = kwargs.get('keeplines')
+        if self.noparse:
+            self.stdout = []
+            self.stderr = []
+        else:
+            self.stdout = collections.deque(maxlen=keeplines)
+            self.stderr = collections.deque(maxlen=keeplines)
+        outfd = cmd.stdout.fileno()
+        errfd = cmd.stderr.fileno()
+        self.callbacks = {outfd: kwargs.get('stdoutcallback'), errfd: kwargs.get('stderrcallback')}
+        self.retained = {outfd: self.stdout, errfd: self.stderr}
+        self.partial = {outfd: '', errfd: ''}
+        self.readfds = [outfd, errfd]
+        if stdin is None:
+            self.pending = ''
+            cmd.stdin.close()
+        else:
+            self.pending = stdin
+        self.stopped = False
+        self.timedout = False
+        self.usage = None
+        if self.timeout is not None:
+            self.deadline = time.time() + self.timeout
+        else:
+            self.deadline = None
+
+    def waittime(self, now):
+        if self.deadline is None:
+            return(None)
+        if len(self.readfds) == 0:
+            return(min(max(self.deadline - now, 0), pollinterval))
+        return(max(self.deadline - now, 0))
+
+    def writefd(self):
+        if len(self.pending) > 0:
+            return(self.cmd.stdin.fileno())
+        return(None)
+
+    def write(self):
+        try:
+            written = os.write(self.cmd.stdin.fileno(), self.pending[:4096])
+        except OSError:
+            written = len(self.pending)
+        self.bytesin += written
+        self.pending = self.pending[written:]
+        if len(self.pending) == 0:
+            self.cmd.stdin.close()
+
+    def read(self, fd):
+        data = os.read(fd, 65536)
+        self.bytesout += len(data)
+        if len(data) == 0:
+            self.readfds.remove(fd)
+            lines = [self.partial[fd]]
+            self.partial[fd] = ''
+        elif self.noparse:
+            self.retained[fd].append(data)
+            return
+        else:
+            lines = (self.partial[fd] + data).split("\n")
+            self.partial[fd] = lines.pop()
+        for line in lines:
+            line = line.rstrip()
+            if len(line) == 0:
+                continue
+            self.retained[fd].append(line)
+            if self.callbacks[fd] is not None and self.callbacks[fd](line) is False:
+                self.stopped = True
+                return
+
+    def done(self, now):
+        if self.stopped or self.timedout:
+            return(True)
+        if len(self.readfds) > 0 or self.deadline is None:
+            if self.deadline is not None and now >= self.deadline:
+                self.timedout = True
+            return(self.timedout or len(self.readfds) == 0)
+        self.usage = profiler.reap(self.cmd, nohang=True)
+        if self.cmd.returncode is None and now >= self.deadline:
+            self.timedout = True
+        return(self.timedout or self.cmd.returncode is not None)
+
+    def finish(self):
+        if len(self.pending) > 0:
+            self.cmd.stdin.close()
+        if self.cmd.returncode is None and (self.stopped or self.timedout):
+            self.cmd.kill()
+        if self.cmd.returncode is None:
+            usage = profiler.reap(self.cmd)
+        else:
+            usage = self.usage
+        returndict = {}
+        if self.noparse:
+            returndict['STDOUT'] = ''.join(self.stdout)
+            returndict['STDERR'] = ''.join(self.stderr)
+        else:
+            returndict['STDOUT'] = list(self.stdout)
+            returndict['STDERR'] = list(self.stderr)
+        if self.timedout:
+            returndict['RESULT'] = 1
+            if not self.noparse:
+                returndict['STDERR'].append("Timed out after " + str(self.timeout) + " seconds")
+        elif self.stopped:
+            returndict['RESULT'] = 0
+        else:
+            returndict['RESULT'] = self.cmd.returncode
+        returndict['STOPPED'] = self.stopped
+        returndict['TIMEDOUT'] = self.timedout
+        if self.command is not None:
+            profiler.recordprocess(self.command, user=self.user, pid=self.cmd.pid, start=self.started, usage=usage,
+                                   bytesin=self.bytesin, bytesout=self.bytesout, result=returndict['RESULT'])
+        return(returndict)
+
+
 def changeuser(user, **kwargs):
     if 'showchange' in kwargs.keys():
         showchange = kwargs['showchange']
     else:
         showchange = False
-    userinfo = pwd.getpwnam(user)
-    newuid = userinfo.pw_uid
-    newgid = userinfo.pw_gid
-    grouplist = [newgid]
-    allgroups = grp.getgrall()
-    for item in allgroups:
-        if user in item[3]:
-            grouplist.append(item[2])
+    import orautils
+    ids = orautils.getuserids(user)
+    newuid = ids['UID']
+    newgid = ids['GID']
+    grouplist = list(ids['GROUPS'])
 
     def set_ids():
         if showchange:
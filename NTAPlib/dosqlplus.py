@@ -27,19 +27,24 @@
 import sys
 import os
 import userio
+import tracing
+import profiler
 import subprocess
-import pwd
-import grp
+import select
+import random
+import re
+import time
+from doprocess import streamprocess
 
+preamble = 'set echo off;\nset feedback off;\nset heading off;\nset pagesize 0;\nset linesize 500;\n'
+reconnecterrors = ['ORA-03113', 'ORA-03114', 'ORA-03135', 'ORA-01012', 'SP2-0640']
+sessions = {}
+sqlerror = re.compile(r'^(ORA|SP2)-[0-9]+')
+colsep = '~|~'
 
-def dosqlplus(sid, sqlcommands, **kwargs):
-    import orautils
-    passkwargs = {'bufsize': 1, 'stdin': subprocess.PIPE, 'stdout': subprocess.PIPE, 'stderr': subprocess.PIPE, 'shell': False}
-
-    commandblock = 'set echo off;\nset feedback off;\nset heading off;\nset pagesize 0;\nset linesize 500;\n'
-    if 'quiet' in kwargs.keys() and kwargs['quiet'] is False:
-        commandblock = ''
 
+def resolveoracle(sid, **kwargs):
+    import orautils
     if 'home' in kwargs.keys():
         oraclehome = kwargs['home']
     else:
@@ -63,7 +68,7 @@ def dosqlplus(sid, sqlcommands, **kwargs):
     if 'user' in kwargs.keys():
         useraccount = kwargs['user']
         try:
-            checkuid = pwd.getpwnam(kwargs['user']).pw_uid
+            checkuid = orautils.getuserids(kwargs['user'])['UID']
         except:
             return({'RESULT': 1,
                     'STDOUT': [],
@@ -77,93 +82,448 @@ def dosqlplus(sid, sqlcommands, **kwargs):
                     'ERRORFLAG': 1,
                     'STDERR': ['Unable to get Oracle user for ' + oraclehome]})
         else:
-            checkuid = pwd.getpwnam(useraccount).pw_uid
+            checkuid = orautils.getuserids(useraccount)['UID']
 
+    preexec = None
     if not checkuid == os.geteuid():
         if os.geteuid() == 0:
-            passkwargs['preexec_fn'] = changeuser(useraccount, showchange=False)
+            preexec = changeuser(useraccount, showchange=False)
         else:
             return({'RESULT': 1,
                     'STDOUT': [],
                     'ERRORFLAG': 1,
                     'STDERR': ['Only root can run sqlplus as alternate user']})
 
+    return({'RESULT': 0, 'HOME': oraclehome, 'BASE': oraclebase, 'PREEXEC': preexec})
+
+
+def getsession(sid, **kwargs):
+    oracle = resolveoracle(sid, **kwargs)
+    if oracle['RESULT'] > 0:
+        return(oracle)
+    key = (sid, oracle['HOME'])
+    if key not in sessions.keys():
+        sessions[key] = SqlplusSession(sid, oracle['HOME'], oracle['BASE'], oracle['PREEXEC'])
+    return({'RESULT': 0, 'SESSION': sessions[key]})
+
+
+def dosqlplus(sid, sqlcommands, **kwargs):
+    passkwargs = {'bufsize': 1, 'stdin': subprocess.PIPE, 'stdout': subprocess.PIPE, 'stderr': subprocess.PIPE, 'shell': False,
+                  'close_fds': True}
+
+    commandblock = preamble
+    if 'quiet' in kwargs.keys() and kwargs['quiet'] is False:
+        commandblock = ''
+
     if 'printstdout' in kwargs.keys():
         printstdout = kwargs['printstdout']
     else:
         printstdout = False
 
-    if type(sqlcommands) is list:
-        for line in sqlcommands:
-            commandblock = commandblock + line + "\n"
-    else:
-        commandblock = commandblock + sqlcommands + "\n"
+    if type(sqlcommands) is not list:
+        sqlcommands = [sqlcommands]
+
+    if 'persist' in kwargs.keys() and kwargs['persist'] and len(commandblock) > 0:
+        out = getsession(sid, **kwargs)
+        if out['RESULT'] > 0:
+            return(out)
+        if 'idempotent' in kwargs.keys():
+            idempotent = kwargs['idempotent']
+        else:
+            idempotent = False
+        return(out['SESSION'].run(sqlcommands, printstdout=printstdout, idempotent=idempotent))
+
+    oracle = resolveoracle(sid, **kwargs)
+    if oracle['RESULT'] > 0:
+        return(oracle)
+    oraclehome = oracle['HOME']
+    oraclebase = oracle['BASE']
+    if oracle['PREEXEC'] is not None:
+        passkwargs['preexec_fn'] = oracle['PREEXEC']
+
+    for line in sqlcommands:
+        commandblock = commandblock + line + "\n"
 
     if not (commandblock[-5: -1]).lower() == 'exit;':
         commandblock = commandblock + "exit;\n"
 
-    stdout = []
-    stderr = []
     returnhash = {}
     returnhash['ERRORFLAG'] = 0
-    mypath = "/bin: /usr/bin:/usr/local/bin:" + oraclehome + "/bin"
-    myldlibrarypath = oraclehome + "/lib"
-    myenv = {"PATH":  mypath,
-             "LD_LIBRARY_PATH": myldlibrarypath,
-             "ORACLE_HOME": oraclehome,
-             "ORACLE_SID": sid,
-             "ORACLE_BASE": oraclebase}
-    passkwargs['env'] = myenv
+    passkwargs['env'] = sqlplusenv(sid, oraclehome, oraclebase)
     sqlpluscmd = subprocess.Popen(['sqlplus', '-S', '/', 'as', 'sysdba'], **passkwargs)
 
     if printstdout:
-        sqlpluscmd.stdin.write(commandblock)
-        while sqlpluscmd.poll() is None:
-            nextline = sqlpluscmd.stdout.readline()
-            nextline = nextline.rstrip()
-            if len(nextline) > 0:
-                userio.message(nextline)
-                stdout.append(nextline)
-        remainder = sqlpluscmd.stdout.readlines()
-        for nextline in remainder:
-            if len(nextline) > 0:
-                userio.message(nextline)
-                stdout.append(nextline)
-        stderr = sqlpluscmd.stderr.readlines()
+        out = streamprocess(sqlpluscmd, commandblock, stdoutcallback=userio.message,
+                            command='sqlplus -S / as sysdba', user=kwargs.get('user'))
     else:
-        cmdout, cmderr = sqlpluscmd.communicate(commandblock)
-        lines = cmdout.splitlines()
-        for line in lines:
-            if len(line) > 0:
-                stdout.append(line)
-        lines = cmderr.splitlines()
-        for line in lines:
-            if line(line) > 0:
-                stderr.append(line)
-
-    for line in stdout:
-        if line[: 5] == 'ERROR' or line[:20] == 'ORACLE not available' or line[:9] == 'ORA-01034:':
-            returnhash['ERRORFLAG'] = 1
+        out = streamprocess(sqlpluscmd, commandblock, command='sqlplus -S / as sysdba', user=kwargs.get('user'))
+    stdout = out['STDOUT']
+    stderr = out['STDERR']
 
+    returnhash['ERRORS'] = sqlerrors(stdout)
+    returnhash['ERRORFLAG'] = errorflag(stdout)
     returnhash['STDOUT'] = stdout
     returnhash['STDERR'] = stderr
     returnhash['RESULT'] = sqlpluscmd.returncode
+    tracing.recordprocess('sqlplus', sqlpluscmd.returncode)
     return(returnhash)
 
 
+def sqlquery(sid, query, **kwargs):
+    out = getsession(sid, **kwargs)
+    if out['RESULT'] > 0:
+        return(SqlplusQuery(None, query, errors=out['STDERR']))
+    return(out['SESSION'].query(query))
+
+
+def sqlerrors(lines):
+    errors = []
+    for line in lines:
+        if sqlerror.match(line):
+            errors.append(line)
+    return(errors)
+
+
+def reconnecterror(line):
+    match = sqlerror.match(line)
+    return(match is not None and match.group(0) in reconnecterrors)
+
+
+def errorflag(lines):
+    for line in lines:
+        if line[:20] == 'ORACLE not available' or sqlerror.match(line):
+            return(1)
+    return(0)
+
+
+def splitcsv(line):
+    fields = []
+    value = ''
+    quoted = False
+    inquotes = False
+    x = 0
+    while x < len(line):
+        char = line[x]
+        if inquotes:
+            if char == '"' and line[x + 1:x + 2] == '"':
+                value = value + '"'
+                x += 1
+            elif char == '"':
+                inquotes = False
+            else:
+                value = value + char
+        elif char == '"':
+            inquotes = True
+            quoted = True
+        elif char == ',':
+            fields.append((value, quoted))
+            value = ''
+            quoted = False
+        else:
+            value = value + char
+        x += 1
+    fields.append((value, quoted))
+    return(fields)
+
+
+def typedvalue(value, quoted):
+    if quoted:
+        return(value)
+    value = value.strip()
+    if len(value) == 0:
+        return(None)
+    try:
+        return(int(value))
+    except ValueError:
+        pass
+    try:
+        return(float(value))
+    except ValueError:
+        return(value)
+
+
+def sqlplusenv(sid, oraclehome, oraclebase):
+    env = {"PATH":  "/bin: /usr/bin:/usr/local/bin:" + oraclehome + "/bin",
+           "LD_LIBRARY_PATH": oraclehome + "/lib",
+           "ORACLE_HOME": oraclehome,
+           "ORACLE_SID": sid,
+           "ORACLE_BASE": oraclebase}
+    env.update(tracing.childenv())
+    return(env)
+
+
+def closesessions(**kwargs):
+    for key in sessions.keys():
+        if 'sid' not in kwargs.keys() or key[0] == kwargs['sid']:
+            sessions[key].close()
+            del sessions[key]
+
+
+class SqlplusSession(object):
+    def __init__(self, sid, oraclehome, oraclebase, preexec):
+        self.sid = sid
+        self.oraclehome = oraclehome
+        self.oraclebase = oraclebase
+        self.preexec = preexec
+        self.process = None
+        self.release = None
+        self.outbuffer = ''
+        self.sentinel = None
+        self.complete = True
+        self.pending = ''
+        self.stderr = ''
+        self.started = None
+        self.bytesin = 0
+        self.bytesout = 0
+
+    def connect(self):
+        self.close()
+        self.outbuffer = ''
+        self.complete = True
+        self.release = None
+        self.started = time.time()
+        self.bytesin = 0
+        self.bytesout = 0
+        try:
+            self.process = subprocess.Popen(['sqlplus', '-S', '/', 'as', 'sysdba'],
+                                            stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE,
+                                            stderr=subprocess.PIPE,
+                                            shell=False,
+                                            close_fds=True,
+                                            preexec_fn=self.preexec,
+                                            env=sqlplusenv(self.sid, self.oraclehome, self.oraclebase))
+        except Exception as e:
+            self.process = None
+            tracing.recordprocess('sqlplus', 1)
+            profiler.recordprocess('sqlplus -S / as sysdba', result=1)
+            return({'RESULT': 1, 'STDOUT': [], 'ERRORFLAG': 1, 'STDERR': ['Unable to start sqlplus: ' + str(e)]})
+        tracing.recordprocess('sqlplus', 0)
+        return(self.exchange(preamble, False))
+
+    def close(self):
+        if self.process is not None:
+            if self.process.poll() is None:
+                try:
+                    self.process.stdin.write("exit;\n")
+                    self.process.stdin.close()
+                except IOError:
+                    pass
+            self.reap()
+            self.process = None
+
+    def reap(self):
+        usage = profiler.reap(self.process)
+        profiler.recordprocess('sqlplus -S / as sysdba', pid=self.process.pid, start=self.started, usage=usage,
+                               bytesin=self.bytesin, bytesout=self.bytesout, result=self.process.returncode)
+
+    def isconnected(self):
+        return(self.process is not None and self.process.poll() is None)
+
+    def send(self, commandblock):
+        self.drain()
+        self.sentinel = 'NTAP-' + ''.join(random.choice('0123456789abcdef') for i in range(32))
+        self.pending = commandblock + "prompt " + self.sentinel + "\n"
+        self.stderr = ''
+        self.complete = False
+
+    def readlines(self):
+        infd = self.process.stdin.fileno()
+        outfd = self.process.stdout.fileno()
+        errfd = self.process.stderr.fileno()
+        readfds = [outfd, errfd]
+        while not self.complete and outfd in readfds:
+            if len(self.pending) > 0:
+                writefds = [infd]
+            else:
+                writefds = []
+            readable, writable = select.select(readfds, writefds, [])[:2]
+            if infd in writable:
+                try:
+                    written = os.write(infd, self.pending[:4096])
+                except OSError:
+                    written = len(self.pending)
+                self.bytesin += written
+                self.pending = self.pending[written:]
+            for fd in readable:
+                data = os.read(fd, 65536)
+                self.bytesout += len(data)
+                if len(data) == 0:
+                    readfds.remove(fd)
+                elif fd == errfd:
+                    self.stderr = self.stderr + data
+                else:
+                    lines = (self.outbuffer + data).split("\n")
+                    self.outbuffer = lines.pop()
+                    for x in range(0, len(lines)):
+                        line = lines[x].rstrip()
+                        if line == self.sentinel:
+                            self.complete = True
+                            self.outbuffer = "\n".join(lines[x + 1:] + [self.outbuffer])
+                            break
+                        yield line
+                    if self.complete:
+                        break
+
+    def drain(self):
+        if not self.complete and self.isconnected():
+            for line in self.readlines():
+                pass
+
+    def exchange(self, commandblock, printstdout):
+        started = time.time()
+        bytesin = self.bytesin
+        bytesout = self.bytesout
+        self.send(commandblock)
+        stdout = []
+        for line in self.readlines():
+            if len(line) > 0:
+                if printstdout:
+                    userio.message(line)
+                stdout.append(line)
+        returnhash = {}
+        returnhash['STDOUT'] = stdout
+        returnhash['STDERR'] = [line for line in self.stderr.splitlines() if len(line) > 0]
+        returnhash['ERRORS'] = sqlerrors(stdout)
+        returnhash['ERRORFLAG'] = errorflag(stdout)
+        pid = self.process.pid
+        if self.complete:
+            returnhash['RESULT'] = 0
+        else:
+            self.reap()
+            returnhash['RESULT'] = max(self.process.returncode, 1)
+            returnhash['ERRORFLAG'] = 1
+            self.process = None
+        statements = [line for line in commandblock.split("\n") if len(line) > 0 and not line.lower().startswith('set ')]
+        profiler.recordexchange((statements + commandblock.split("\n"))[0], pid=pid, start=started,
+                                bytesin=self.bytesin - bytesin, bytesout=self.bytesout - bytesout,
+                                result=returnhash['RESULT'])
+        return(returnhash)
+
+    def run(self, sqlcommands, **kwargs):
+        if 'printstdout' in kwargs.keys():
+            printstdout = kwargs['printstdout']
+        else:
+            printstdout = False
+        if 'idempotent' in kwargs.keys():
+            idempotent = kwargs['idempotent']
+        else:
+            idempotent = False
+        commandblock = ''
+        reconnect = False
+        for line in sqlcommands:
+            if line.strip().lower().rstrip(';') in ['exit', 'quit']:
+                continue
+            if line.strip().lower().startswith('shutdown'):
+                reconnect = True
+            commandblock = commandblock + line + "\n"
+        if reconnect:
+            commandblock = commandblock + "connect / as sysdba\n"
+        for attempt in range(0, 2):
+            if not self.isconnected():
+                out = self.connect()
+                if out['RESULT'] > 0:
+                    return(out)
+            out = self.exchange(commandblock, printstdout)
+            lost = False
+            for line in out['STDOUT']:
+                if reconnecterror(line):
+                    lost = True
+            if not lost:
+                break
+            self.close()
+            if not idempotent:
+                break
+        return(out)
+
+    def csvmarkup(self):
+        if self.release is None:
+            out = self.run(['prompt &_SQLPLUS_RELEASE'], idempotent=True)
+            try:
+                self.release = int(out['STDOUT'][-1][:4])
+            except (IndexError, ValueError):
+                self.release = 0
+        return(self.release >= 1202)
+
+    def query(self, query):
+        if not self.isconnected():
+            out = self.connect()
+            if out['RESULT'] > 0:
+                return(SqlplusQuery(None, query, errors=out['STDERR']))
+        return(SqlplusQuery(self, query))
+
+
+class SqlplusQuery(object):
+    def __init__(self, session, query, **kwargs):
+        self.session = session
+        self.query = query.rstrip().rstrip(';') + ';'
+        self.columns = None
+        if 'errors' in kwargs.keys():
+            self.errors = list(kwargs['errors'])
+        else:
+            self.errors = []
+
+    def __iter__(self):
+        if self.session is None:
+            return
+        csvmode = self.session.csvmarkup()
+        commandblock = 'set heading on;\nset pagesize 50000;\nset linesize 32767;\nset trimout on;\n'
+        if csvmode:
+            commandblock = commandblock + 'set markup csv on quote on;\n'
+        else:
+            commandblock = commandblock + "set underline off;\nset tab off;\nset colsep '" + colsep + "';\n"
+        commandblock = commandblock + self.query + "\n"
+        if csvmode:
+            commandblock = commandblock + 'set markup csv off;\n'
+        commandblock = commandblock + "set colsep ' ';\nset underline on;\n" + preamble
+        started = time.time()
+        bytesin = self.session.bytesin
+        bytesout = self.session.bytesout
+        pid = self.session.process.pid
+        self.session.send(commandblock)
+        header = None
+        for line in self.session.readlines():
+            if len(line.strip()) == 0 or line == header:
+                continue
+            elif sqlerror.match(line):
+                self.errors.append(line)
+                continue
+            elif line[:5] == 'ERROR':
+                continue
+            if csvmode:
+                fields = splitcsv(line)
+            else:
+                fields = [(item, False) for item in line.split(colsep)]
+            if header is None:
+                header = line
+                self.columns = [value.strip() for value, quoted in fields]
+                continue
+            row = {}
+            for x in range(0, min(len(fields), len(self.columns))):
+                value, quoted = fields[x]
+                if not csvmode:
+                    value = value.strip()
+                row[self.columns[x]] = typedvalue(value, quoted)
+            yield row
+        if not self.session.complete:
+            self.errors.append('sqlplus session ended unexpectedly')
+        profiler.recordexchange(self.query, pid=pid, start=started, bytesin=self.session.bytesin - bytesin,
+                                bytesout=self.session.bytesout - bytesout, result=min(len(self.errors), 1))
+
+    def rows(self):
+        return([row for row in self])
+
+
 def changeuser(user, **kwargs):
     if 'showchange' in kwargs.keys():
         showchange = kwargs['showchange']
     else:
         showchange = False
-    userinfo = pwd.getpwnam(user)
-    newuid = userinfo.pw_uid
-    newgid = userinfo.pw_gid
-    grouplist = [newgid]
-    allgroups = grp.getgrall()
-    for item in allgroups:
-        if user in item[3]:
-            grouplist.append(item[2])
+    import orautils
+    ids = orautils.getuserids(user)
+    newuid = ids['UID']
+    newgid = ids['GID']
+    grouplist = list(ids['GROUPS'])
 
     def set_ids():
         if showchange:
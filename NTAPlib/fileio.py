@@ -29,6 +29,17 @@ import os
 import userio
 import subprocess
 import random
+import select
+import fcntl
+import errno
+import time
+import re
+import ctypes
+import ctypes.util
+import mmap
+import StringIO
+
+chunksize = 65536
 
 if os.name == 'posix':
     import pwd
@@ -165,59 +176,177 @@ def checkfileprotection(filepath):
     return(returncode)
 
 
-def decryptpath(encryptedpath, keyfile):
-    servicename = 'decrypt'
-    fh = open(encryptedpath, 'rb+')
-    encrypteddata = fh.read()[:-32]
-    fh.seek(-32, 2)
-    iv = fh.read(32)
-    fh.close()
+def sslenv():
     mypath = "/bin:/usr/bin:/usr/local/bin:"
     myldlibrarypath = "/lib"
-    myenv = {"PATH": mypath, "LD_LIBRARY_PATH": myldlibrarypath}
+    return({"PATH": mypath, "LD_LIBRARY_PATH": myldlibrarypath})
+
+
+def mapfile(fh, length):
+    if length == 0:
+        return('')
+    try:
+        return(mmap.mmap(fh.fileno(), length, access=mmap.ACCESS_READ))
+    except (mmap.error, ValueError, EnvironmentError):
+        return(None)
+
+
+def pipethrough(procargs, source, length, sink):
+    try:
+        sslprocess = subprocess.Popen(procargs,
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE,
+                                      stdin=subprocess.PIPE,
+                                      shell=False,
+                                      close_fds=True,
+                                      env=sslenv())
+    except (OSError, TypeError, ValueError) as e:
+        return({'RESULT': 1, 'STDERR': ['Unable to start openssl: ' + str(e)]})
+    infd = sslprocess.stdin.fileno()
+    fcntl.fcntl(infd, fcntl.F_SETFL, fcntl.fcntl(infd, fcntl.F_GETFL) | os.O_NONBLOCK)
+    outfd = sslprocess.stdout.fileno()
+    errfd = sslprocess.stderr.fileno()
+    readfds = [outfd, errfd]
+    offset = 0
+    stderr = []
+    if length == 0:
+        sslprocess.stdin.close()
+    while len(readfds) > 0:
+        if offset < length:
+            writefds = [infd]
+        else:
+            writefds = []
+        try:
+            readable, writable = select.select(readfds, writefds, [])[:2]
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                continue
+            raise
+        if len(writable) > 0:
+            if hasattr(source, 'read') and not hasattr(source, 'size'):
+                chunk = source.read(min(chunksize, length - offset))
+            else:
+                chunk = source[offset:offset + min(chunksize, length - offset)]
+            try:
+                written = os.write(infd, chunk)
+            except OSError as e:
+                if e.errno in [errno.EAGAIN, errno.EINTR]:
+                    written = 0
+                else:
+                    written = length - offset
+            if written < len(chunk) and hasattr(source, 'seek') and not hasattr(source, 'size'):
+                source.seek(written - len(chunk), 1)
+            offset += written
+            if offset >= length:
+                sslprocess.stdin.close()
+        for fd in readable:
+            try:
+                data = os.read(fd, chunksize)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            if len(data) == 0:
+                readfds.remove(fd)
+            elif fd == outfd:
+                sink.write(data)
+            else:
+                stderr.append(data)
+    if offset < length:
+        sslprocess.stdin.close()
+    sslprocess.wait()
+    stderr = ''.join(stderr).splitlines()
+    if not sslprocess.returncode == 0:
+        return({'RESULT': 1, 'STDERR': stderr})
+    return({'RESULT': 0, 'STDERR': []})
+
+
+def decryptstream(encryptedpath, keyfile, sink):
+    try:
+        fh = open(encryptedpath, 'rb')
+    except IOError as e:
+        return({'RESULT': 1, 'STDERR': [str(e)]})
+    length = os.fstat(fh.fileno()).st_size - 32
+    if length < 0:
+        fh.close()
+        return({'RESULT': 1, 'STDERR': ['File too short: ' + encryptedpath]})
+    fh.seek(length)
+    iv = fh.read(32)
+    if len(iv.strip('0123456789abcdef')) > 0:
+        fh.close()
+        return({'RESULT': 1, 'STDERR': ['File is not encrypted: ' + encryptedpath]})
+    fh.seek(0)
+    source = mapfile(fh, length)
+    if source is None:
+        source = fh
     procargs = ['openssl', 'enc', '-d', '-aes-256-cbc', '-z', '-kfile', keyfile, '-iv', iv]
-    sslprocess = subprocess.Popen(procargs,
-                                  stdout=subprocess.PIPE,
-                                  stderr=subprocess.PIPE,
-                                  stdin=subprocess.PIPE,
-                                  shell=False,
-                                  env=myenv)
-    out, err = sslprocess.communicate(input=encrypteddata)
-    if len(err) > 0:
-        for line in out.split("\n"):
-            userio.message(servicename, "  stdout: " + line)
-        for line in err.split("\n"):
-            userio.message(servicename, "  stderr: " + line)
-        userio.messageanddie("Fatal openssl decryption error")
+    out = pipethrough(procargs, source, length, sink)
+    if hasattr(source, 'close') and source is not fh:
+        source.close()
+    fh.close()
     return(out)
 
 
-def encryptpath(plaintextstring, encryptedpath, keyfile):
-    if not checkfile(encryptedpath, 'w') == 0:
-        releaselock()
-        messageanddie('Could not open file for writing' + encryptedpath)
+def encryptstream(source, length, encryptedpath, keyfile):
+    try:
+        open(encryptedpath, 'wb').close()
+    except IOError as e:
+        return({'RESULT': 1, 'STDERR': ['Could not open file for writing ' + encryptedpath, str(e)]})
     iv = ''.join(random.choice('0123456789abcdef') for _ in range(32))
-    mypath = "/bin:/usr/bin:/usr/local/bin:"
-    myldlibrarypath = "/lib"
-    myenv = {"PATH": mypath, "LD_LIBRARY_PATH": myldlibrarypath}
     procargs = ['openssl', 'enc', '-aes-256-cbc', '-z', '-kfile', keyfile, '-iv', iv, '-out', encryptedpath]
-    sslprocess = subprocess.Popen(procargs,
-                                  stdout=subprocess.PIPE,
-                                  stderr=subprocess.PIPE,
-                                  stdin=subprocess.PIPE,
-                                  shell=False,
-                                  env=myenv)
-    out, err = sslprocess.communicate(input=plaintextstring)
-    if len(out) > 0 or len(err) > 0:
-        message("Fatal openssl encryption error")
-        for line in out.split("\n"):
-            message("   stdout: " + line)
-        for line in err.split("\n"):
-            message("   stderr: " + line)
-        sys.exit(1)
+    out = pipethrough(procargs, source, length, StringIO.StringIO())
+    if out['RESULT'] > 0:
+        return(out)
     fh = open(encryptedpath, 'ab')
     fh.write(iv)
     fh.close()
+    return(out)
+
+
+def decryptfile(encryptedpath, plaintextpath, keyfile):
+    try:
+        sink = open(plaintextpath, 'wb')
+    except IOError as e:
+        return({'RESULT': 1, 'STDERR': [str(e)]})
+    out = decryptstream(encryptedpath, keyfile, sink)
+    sink.close()
+    return(out)
+
+
+def encryptfile(plaintextpath, encryptedpath, keyfile):
+    try:
+        fh = open(plaintextpath, 'rb')
+    except IOError as e:
+        return({'RESULT': 1, 'STDERR': [str(e)]})
+    length = os.fstat(fh.fileno()).st_size
+    source = mapfile(fh, length)
+    if source is None:
+        source = fh
+    out = encryptstream(source, length, encryptedpath, keyfile)
+    if hasattr(source, 'close') and source is not fh:
+        source.close()
+    fh.close()
+    return(out)
+
+
+def decryptpath(encryptedpath, keyfile):
+    servicename = 'decrypt'
+    sink = StringIO.StringIO()
+    out = decryptstream(encryptedpath, keyfile, sink)
+    if out['RESULT'] > 0:
+        for line in out['STDERR']:
+            userio.message("  stderr: " + line, service=servicename)
+        userio.fail("Fatal openssl decryption error")
+    return(sink.getvalue())
+
+
+def encryptpath(plaintextstring, encryptedpath, keyfile):
+    out = encryptstream(plaintextstring, len(plaintextstring), encryptedpath, keyfile)
+    if out['RESULT'] > 0:
+        userio.message("Fatal openssl encryption error")
+        for line in out['STDERR']:
+            userio.message("   stderr: " + line)
+        sys.exit(1)
     return(0)
 
 
@@ -243,3 +372,156 @@ def setownership(path, **kwargs):
         return(True)
     except:
         return(False)
+
+
+inotifyevents = 0x00000002 | 0x00000040 | 0x00000080 | 0x00000100 | 0x00000200 | 0x00000004
+oraerror = re.compile(r'(ORA-[0-9]+)')
+oraclasses = {'ORA-00600': 'internal',
+              'ORA-07445': 'internal',
+              'ORA-04030': 'memory',
+              'ORA-04031': 'memory',
+              'ORA-00257': 'archiver',
+              'ORA-16038': 'archiver',
+              'ORA-19502': 'io',
+              'ORA-27072': 'io',
+              'ORA-01578': 'corruption',
+              'ORA-00353': 'corruption'}
+
+
+def inotifywatch(path):
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK)
+        if fd < 0:
+            return(None)
+        if libc.inotify_add_watch(fd, path, inotifyevents) < 0:
+            os.close(fd)
+            return(None)
+        return(fd)
+    except (AttributeError, OSError, TypeError):
+        return(None)
+
+
+class FileFollower(object):
+    def __init__(self, path, **kwargs):
+        self.path = path
+        self.interval = kwargs.get('interval', 1)
+        self.fromstart = kwargs.get('fromstart', False) or not os.path.exists(path)
+        self.fh = None
+        self.inode = None
+        self.offset = 0
+        self.partial = ''
+        self.lines = 0
+        self.errors = {}
+        self.classes = {}
+        self.watchfd = inotifywatch(os.path.dirname(path) or '.')
+
+    def counters(self):
+        return({'LINES': self.lines, 'ERRORS': dict(self.errors), 'CLASSES': dict(self.classes)})
+
+    def classify(self, line):
+        self.lines += 1
+        for code in set(oraerror.findall(line)):
+            self.errors[code] = self.errors.get(code, 0) + 1
+            errorclass = oraclasses.get(code, 'other')
+            self.classes[errorclass] = self.classes.get(errorclass, 0) + 1
+
+    def reopen(self, fromstart):
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+        try:
+            self.fh = open(self.path, 'rb')
+        except IOError:
+            return(False)
+        self.inode = os.fstat(self.fh.fileno()).st_ino
+        if fromstart:
+            self.offset = 0
+        else:
+            self.fh.seek(0, 2)
+            self.offset = self.fh.tell()
+        self.partial = ''
+        return(True)
+
+    def readlines(self):
+        lines = []
+        while True:
+            data = self.fh.read(65536)
+            if len(data) == 0:
+                break
+            self.offset += len(data)
+            chunk = (self.partial + data).split("\n")
+            self.partial = chunk.pop()
+            for line in chunk:
+                line = line.rstrip()
+                self.classify(line)
+                lines.append(line)
+        return(lines)
+
+    def poll(self):
+        if self.fh is None:
+            if not self.reopen(self.fromstart or self.inode is not None):
+                return([])
+        lines = self.readlines()
+        try:
+            pathstat = os.stat(self.path)
+        except OSError:
+            return(lines)
+        if not pathstat.st_ino == self.inode:
+            lines = lines + self.readlines()
+            if self.reopen(True):
+                lines = lines + self.readlines()
+        elif pathstat.st_size < self.offset:
+            self.fh.seek(0)
+            self.offset = 0
+            self.partial = ''
+            lines = lines + self.readlines()
+        return(lines)
+
+    def wait(self, timeout):
+        if self.watchfd is None:
+            time.sleep(timeout)
+            return
+        readable = select.select([self.watchfd], [], [], timeout)[0]
+        if len(readable) > 0:
+            try:
+                os.read(self.watchfd, 65536)
+            except OSError:
+                pass
+
+    def follow(self, callback, **kwargs):
+        if 'reportinterval' in kwargs.keys():
+            reportinterval = kwargs['reportinterval']
+        else:
+            reportinterval = None
+        if 'report' in kwargs.keys():
+            report = kwargs['report']
+        else:
+            report = None
+        nextreport = None
+        if reportinterval is not None:
+            nextreport = time.time() + reportinterval
+        while True:
+            for line in self.poll():
+                if callback(line) is False:
+                    return(self.counters())
+            if nextreport is not None and time.time() >= nextreport:
+                report(self.counters())
+                nextreport = time.time() + reportinterval
+            self.wait(self.interval)
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+        if self.watchfd is not None:
+            os.close(self.watchfd)
+            self.watchfd = None
+
+
+def followfile(path, callback, **kwargs):
+    follower = FileFollower(path, **kwargs)
+    try:
+        return(follower.follow(callback, **kwargs))
+    finally:
+        follower.close()
@@ -0,0 +1,564 @@
+#! /usr/bin/python
+###########################################################################
+# (c) 2019 NetApp Inc. (NetApp), All Rights Reserved
+#
+# NetApp disclaims all warranties, excepting NetApp shall provide
+# support of unmodified software pursuant to a valid, separate,
+# purchased support agreement.  No distribution or modification of
+# this software is permitted by NetApp, except under separate
+# written agreement, which may be withheld at NetApp's sole
+# discretion.
+#
+# THIS SOFTWARE IS PROVIDED BY NETAPP "AS IS" AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL NETAPP BE LIABLE FOR ANY DIRECT,
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# Created by Jeffrey Steiner, jfs@netapp.com
+#
+###########################################################################
+import os
+import json
+import time
+import atexit
+import shutil
+import threading
+import profiler
+
+resources = {'pod': ('Pod', '/api/v1', 'pods'),
+             'deployment': ('Deployment', '/apis/apps/v1', 'deployments'),
+             'persistentvolumeclaim': ('PersistentVolumeClaim', '/api/v1', 'persistentvolumeclaims')}
+aliases = {'pods': 'pod', 'po': 'pod',
+           'deployments': 'deployment', 'deploy': 'deployment',
+           'pvc': 'persistentvolumeclaim', 'pvcs': 'persistentvolumeclaim',
+           'persistentvolumeclaims': 'persistentvolumeclaim'}
+fieldmanager = 'ntap-dbaas'
+requesttimeout = 30
+pagesize = 500
+reconnectdelay = 1
+config = None
+disabled = False
+local = threading.local()
+connections = []
+tempdir = None
+
+
+def loadmodules():
+    # The HTTP and SSL modules roughly double the footprint of a short dbaas
+    # run, so they are only imported once the API backend is actually used.
+    global ssl, base64, socket, httplib, urllib, urlparse, tempfile
+    import ssl
+    import base64
+    import socket
+    import httplib
+    import urllib
+    import urlparse
+    import tempfile
+
+
+def enabled():
+    setting = os.environ.get('NTAP_KUBEAPI')
+    return(setting is not None and setting not in ['', '0'] and not disabled)
+
+
+def disable():
+    global disabled
+    disabled = True
+    closeall()
+
+
+def yamlscalar(value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in ['"', "'"]:
+        return(value[1:-1])
+    elif value in ['', '~', 'null']:
+        return(None)
+    elif value == 'true':
+        return(True)
+    elif value == 'false':
+        return(False)
+    return(value)
+
+
+def yamlblock(lines, index, indent):
+    if lines[index][1] == '-' or lines[index][1].startswith('- '):
+        result = []
+        while index < len(lines) and lines[index][0] == indent and \
+                (lines[index][1] == '-' or lines[index][1].startswith('- ')):
+            content = lines[index][1][1:].strip()
+            if len(content) == 0:
+                value, index = yamlblock(lines, index + 1, lines[index + 1][0])
+            elif ': ' in content or content.endswith(':'):
+                lines[index] = (indent + len(lines[index][1]) - len(content), content)
+                value, index = yamlblock(lines, index, lines[index][0])
+            else:
+                value = yamlscalar(content)
+                index += 1
+            result.append(value)
+        return(result, index)
+    result = {}
+    while index < len(lines) and lines[index][0] == indent and not lines[index][1].startswith('- '):
+        key, separator, value = lines[index][1].partition(':')
+        index += 1
+        if len(value.strip()) > 0:
+            result[yamlscalar(key)] = yamlscalar(value)
+        elif index < len(lines) and (lines[index][0] > indent or
+                                     (lines[index][0] == indent and lines[index][1].startswith('-'))):
+            result[yamlscalar(key)], index = yamlblock(lines, index, lines[index][0])
+        else:
+            result[yamlscalar(key)] = None
+    return(result, index)
+
+
+def parseyaml(text):
+    lines = []
+    for line in text.splitlines():
+        content = line.strip()
+        if len(content) == 0 or content.startswith('#') or content == '---':
+            continue
+        lines.append((len(line) - len(line.lstrip()), content))
+    if len(lines) == 0:
+        return({})
+    return(yamlblock(lines, 0, lines[0][0])[0])
+
+
+def named(entries, name):
+    for entry in entries or []:
+        if type(entry) is dict and entry.get('name') == name:
+            return(entry)
+    return({})
+
+
+def datafile(data, suffix):
+    global tempdir
+    if tempdir is None:
+        tempdir = tempfile.mkdtemp(prefix='ntap-kubeapi-')
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=tempdir)
+    os.write(fd, base64.b64decode(data))
+    os.close(fd)
+    return(path)
+
+
+def loadconfig(path):
+    try:
+        document = parseyaml(open(path).read())
+    except (IOError, OSError):
+        return(None)
+    if type(document) is not dict:
+        return(None)
+    context = named(document.get('contexts'), document.get('current-context')).get('context') or {}
+    cluster = named(document.get('clusters'), context.get('cluster')).get('cluster') or {}
+    user = named(document.get('users'), context.get('user')).get('user') or {}
+    if cluster.get('server') is None:
+        return(None)
+    settings = {'SERVER': cluster['server'],
+                'NAMESPACE': context.get('namespace') or 'default',
+                'INSECURE': cluster.get('insecure-skip-tls-verify') in [True, 'true'],
+                'CAFILE': cluster.get('certificate-authority'),
+                'CERTFILE': user.get('client-certificate'),
+                'KEYFILE': user.get('client-key'),
+                'TOKEN': user.get('token')}
+    if cluster.get('certificate-authority-data') is not None:
+        settings['CAFILE'] = datafile(cluster['certificate-authority-data'], '.ca')
+    if user.get('client-certificate-data') is not None:
+        settings['CERTFILE'] = datafile(user['client-certificate-data'], '.crt')
+    if user.get('client-key-data') is not None:
+        settings['KEYFILE'] = datafile(user['client-key-data'], '.key')
+    if user.get('tokenFile') is not None and settings['TOKEN'] is None:
+        try:
+            settings['TOKEN'] = open(user['tokenFile']).read().strip()
+        except IOError:
+            return(None)
+    return(settings)
+
+
+def getconfig(kubeconfig):
+    global config
+    if config is None:
+        loadmodules()
+        setting = os.environ.get('NTAP_KUBEAPI')
+        if setting is not None and os.path.isfile(setting):
+            kubeconfig = setting
+        config = loadconfig(kubeconfig)
+        if config is None:
+            disable()
+    return(config)
+
+
+def newconnection(**kwargs):
+    if 'timeout' in kwargs.keys():
+        timeout = kwargs['timeout']
+    else:
+        timeout = requesttimeout
+    url = urlparse.urlparse(config['SERVER'])
+    if url.scheme == 'http':
+        return(httplib.HTTPConnection(url.hostname, url.port or 80, timeout=timeout))
+    context = ssl.create_default_context(cafile=config['CAFILE'])
+    if config['INSECURE']:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    if config['CERTFILE'] is not None:
+        context.load_cert_chain(config['CERTFILE'], config['KEYFILE'])
+    return(httplib.HTTPSConnection(url.hostname, url.port or 443, timeout=timeout, context=context))
+
+
+def connection():
+    conn = getattr(local, 'connection', None)
+    if conn is None:
+        conn = newconnection()
+        local.connection = conn
+        connections.append(conn)
+    return(conn)
+
+
+def headers(**kwargs):
+    result = {'Accept': 'application/json', 'User-Agent': 'ntap-dbaas'}
+    if config['TOKEN'] is not None:
+        result['Authorization'] = 'Bearer ' + config['TOKEN']
+    if 'contenttype' in kwargs.keys():
+        result['Content-Type'] = kwargs['contenttype']
+    return(result)
+
+
+def request(method, path, **kwargs):
+    if 'body' in kwargs.keys():
+        body = kwargs['body']
+    else:
+        body = None
+    for attempt in range(0, 2):
+        started = time.time()
+        try:
+            conn = connection()
+            conn.request(method, path, body, headers(**kwargs))
+            response = conn.getresponse()
+            data = response.read()
+        except (socket.error, ssl.SSLError, httplib.HTTPException, IOError):
+            if getattr(local, 'connection', None) is not None:
+                local.connection.close()
+                local.connection = None
+            continue
+        profiler.recordexchange(method + ' ' + path, tool='kubeapi', start=started, bytesin=len(body or ''),
+                                bytesout=len(data), result=int(response.status >= 400))
+        if response.status >= 400:
+            return({'RESULT': 1, 'STATUS': response.status, 'BODY': data, 'STDERR': [errormessage(response.status, data)]})
+        return({'RESULT': 0, 'STATUS': response.status, 'BODY': data, 'STDERR': []})
+    disable()
+    return(None)
+
+
+def errormessage(status, data):
+    try:
+        message = json.loads(data).get('message')
+    except (ValueError, AttributeError):
+        message = None
+    if status == 404 and message is None:
+        message = 'not found'
+    if message is None:
+        message = data.strip()
+    return('Error from server (' + str(status) + '): ' + message)
+
+
+def resource(kind):
+    key = kind.lower()
+    if key in aliases.keys():
+        key = aliases[key]
+    return(resources.get(key))
+
+
+def collectionpath(kind, **kwargs):
+    kindname, prefix, plural = resource(kind)
+    path = prefix + '/namespaces/' + config['NAMESPACE'] + '/' + plural
+    if 'name' in kwargs.keys() and kwargs['name'] is not None:
+        path = path + '/' + urllib.quote(kwargs['name'])
+    return(path)
+
+
+def usable(kubeconfig, kinds):
+    if not enabled() or getconfig(kubeconfig) is None:
+        return(False)
+    for kind in kinds:
+        if resource(kind) is None:
+            return(False)
+    return(True)
+
+
+def listobjects(kubeconfig, kinds, **kwargs):
+    if not usable(kubeconfig, kinds):
+        return(None)
+    query = {'limit': str(pagesize)}
+    if 'selector' in kwargs.keys() and kwargs['selector'] is not None:
+        query['labelSelector'] = kwargs['selector']
+    if 'callback' in kwargs.keys():
+        callback = kwargs['callback']
+    else:
+        callback = None
+    items = []
+    versions = {}
+    for kind in kinds:
+        query.pop('continue', None)
+        while True:
+            out = request('GET', collectionpath(kind) + '?' + urllib.urlencode(query))
+            if out is None or out['RESULT'] > 0:
+                return(out)
+            try:
+                document = json.loads(out['BODY'])
+            except ValueError:
+                return({'RESULT': 1, 'ITEMS': [], 'STDERR': ['Unable to parse ' + kind + ' list from API server']})
+            for item in document.get('items') or []:
+                item['kind'] = resource(kind)[0]
+                if callback is not None:
+                    callback(item)
+                else:
+                    items.append(item)
+            if kind not in versions.keys():
+                versions[kind] = (document.get('metadata') or {}).get('resourceVersion')
+            nextpage = (document.get('metadata') or {}).get('continue')
+            if not nextpage:
+                break
+            query['continue'] = nextpage
+    return({'RESULT': 0, 'ITEMS': items, 'VERSIONS': versions, 'STDERR': []})
+
+
+def getobject(kubeconfig, kind, name):
+    if not usable(kubeconfig, [kind]):
+        return(None)
+    return(request('GET', collectionpath(kind, name=name)))
+
+
+def deleteobject(kubeconfig, kind, name):
+    if not usable(kubeconfig, [kind]):
+        return(None)
+    out = request('DELETE', collectionpath(kind, name=name), body=json.dumps({'propagationPolicy': 'Background'}),
+                  contenttype='application/json')
+    if out is not None and out['RESULT'] == 0:
+        out['STDOUT'] = [resource(kind)[0].lower() + ' "' + name + '" deleted']
+    return(out)
+
+
+def patchobject(kubeconfig, kind, name, body, **kwargs):
+    if not usable(kubeconfig, [kind]):
+        return(None)
+    if 'patchtype' in kwargs.keys():
+        patchtype = kwargs['patchtype']
+    else:
+        patchtype = 'merge'
+    out = request('PATCH', collectionpath(kind, name=name), body=body,
+                  contenttype='application/' + patchtype + '-patch+json')
+    if out is not None and out['RESULT'] == 0:
+        out['STDOUT'] = [resource(kind)[0].lower() + '/' + name + ' patched']
+    return(out)
+
+
+def manifestobjects(yamltext):
+    objects = []
+    for document in yamltext.split('\n---'):
+        kind = None
+        name = None
+        section = None
+        for line in document.splitlines():
+            if line.startswith('kind:'):
+                kind = yamlscalar(line[5:])
+            elif len(line) > 0 and not line[0] == ' ':
+                section = line.split(':')[0]
+            elif section == 'metadata' and name is None and line.startswith('  name:'):
+                name = yamlscalar(line[7:])
+        if kind is not None and name is not None:
+            objects.append((kind, name, document.lstrip('-\n')))
+    return(objects)
+
+
+def applymanifest(kubeconfig, yamltext):
+    objects = manifestobjects(yamltext)
+    if not usable(kubeconfig, [kind for kind, name, document in objects]):
+        return(None)
+    query = '?' + urllib.urlencode({'fieldManager': fieldmanager, 'force': 'true'})
+    applied = []
+    for kind, name, document in objects:
+        out = request('PATCH', collectionpath(kind, name=name) + query, body=document,
+                      contenttype='application/apply-patch+yaml')
+        if out is None:
+            return(None)
+        elif out['RESULT'] > 0 and out['STATUS'] in [404, 405, 415] and len(applied) == 0:
+            return(None)
+        elif out['RESULT'] > 0:
+            return({'RESULT': 1, 'OBJECTS': applied, 'STDOUT': [], 'STDERR': out['STDERR']})
+        if out['STATUS'] == 201:
+            applied.append((kind.lower(), name, 'created'))
+        else:
+            applied.append((kind.lower(), name, 'configured'))
+    return({'RESULT': 0, 'OBJECTS': applied, 'STDOUT': [kind + '/' + name + ' ' + action for kind, name, action in applied],
+            'STDERR': []})
+
+
+def streamchunks(response):
+    if response.chunked:
+        while True:
+            size = int(response.fp.readline().split(';')[0], 16)
+            if size == 0:
+                break
+            data = response.fp.read(size)
+            response.fp.readline()
+            yield data
+    else:
+        while True:
+            data = response.fp.readline()
+            if len(data) == 0:
+                break
+            yield data
+
+
+def stream(path, callback, **kwargs):
+    if 'timeout' in kwargs.keys() and kwargs['timeout'] is not None:
+        deadline = time.time() + kwargs['timeout']
+    else:
+        deadline = None
+    returndict = {'RESULT': 0, 'STDOUT': [], 'STDERR': [], 'STOPPED': False, 'TIMEDOUT': False}
+    conn = newconnection(timeout=requesttimeout)
+    buffer = ''
+    started = time.time()
+    bytesout = 0
+    try:
+        conn.request('GET', path, None, headers())
+        sock = conn.sock
+        response = conn.getresponse()
+        if response.status >= 400:
+            conn.close()
+            returndict['RESULT'] = 1
+            returndict['STATUS'] = response.status
+            returndict['STDERR'].append(errormessage(response.status, response.read()))
+            return(returndict)
+        if deadline is not None:
+            sock.settimeout(max(deadline - time.time(), 0.01))
+        else:
+            sock.settimeout(None)
+        for data in streamchunks(response):
+            bytesout += len(data)
+            lines = (buffer + data).split('\n')
+            buffer = lines.pop()
+            for line in lines:
+                if len(line.rstrip()) > 0 and callback(line.rstrip()) is False:
+                    returndict['STOPPED'] = True
+                    break
+            if returndict['STOPPED']:
+                break
+            if deadline is not None:
+                if time.time() >= deadline:
+                    raise socket.timeout()
+                sock.settimeout(deadline - time.time())
+        if not returndict['STOPPED'] and len(buffer.rstrip()) > 0:
+            callback(buffer.rstrip())
+    except KeyboardInterrupt:
+        returndict['STOPPED'] = True
+    except socket.timeout:
+        returndict['RESULT'] = 1
+        returndict['TIMEDOUT'] = True
+        returndict['STDERR'].append("Timed out after " + str(kwargs['timeout']) + " seconds")
+    except (socket.error, ssl.SSLError, httplib.HTTPException, IOError, ValueError) as e:
+        returndict['RESULT'] = 1
+        returndict['STDERR'].append('API server stream failed: ' + str(e))
+    conn.close()
+    profiler.recordexchange('GET ' + path, tool='kubeapi', start=started, bytesout=bytesout,
+                            result=returndict['RESULT'])
+    return(returndict)
+
+
+def resourceversion(obj):
+    if type(obj) is not dict or type(obj.get('metadata')) is not dict:
+        return(None)
+    return(obj['metadata'].get('resourceVersion'))
+
+
+def watch(kubeconfig, kind, callback, **kwargs):
+    if not usable(kubeconfig, [kind]):
+        return(None)
+    query = {'watch': '1', 'allowWatchBookmarks': 'true'}
+    state = {'VERSION': kwargs.get('version'), 'EXPIRED': False}
+    if 'name' in kwargs.keys() and kwargs['name'] is not None:
+        out = request('GET', collectionpath(kind, name=kwargs['name']))
+        if out is None:
+            return(None)
+        elif out['RESULT'] > 0:
+            return({'RESULT': 1, 'STDOUT': [], 'STDERR': out['STDERR'], 'STOPPED': False, 'TIMEDOUT': False})
+        try:
+            state['VERSION'] = resourceversion(json.loads(out['BODY']))
+        except ValueError:
+            pass
+        query['fieldSelector'] = 'metadata.name=' + kwargs['name']
+    if 'selector' in kwargs.keys() and kwargs['selector'] is not None:
+        query['labelSelector'] = kwargs['selector']
+    if 'timeout' in kwargs.keys() and kwargs['timeout'] is not None:
+        deadline = time.time() + kwargs['timeout']
+    else:
+        deadline = None
+
+    def nextline(line):
+        try:
+            event = json.loads(line)
+        except ValueError:
+            event = None
+        if type(event) is dict:
+            if event.get('type') == 'ERROR' and (event.get('object') or {}).get('code') == 410:
+                state['EXPIRED'] = True
+                return(False)
+            if resourceversion(event.get('object')) is not None:
+                state['VERSION'] = resourceversion(event['object'])
+            if event.get('type') == 'BOOKMARK':
+                return(True)
+        return(callback(line))
+
+    while True:
+        if state['VERSION'] is not None:
+            query['resourceVersion'] = state['VERSION']
+        else:
+            query.pop('resourceVersion', None)
+        if deadline is not None:
+            timeout = max(deadline - time.time(), 0.01)
+        else:
+            timeout = None
+        started = time.time()
+        out = stream(collectionpath(kind) + '?' + urllib.urlencode(query), nextline, timeout=timeout)
+        if out['TIMEDOUT']:
+            out['STDERR'] = ["Timed out after " + str(kwargs['timeout']) + " seconds"]
+        if state['EXPIRED'] or out.get('STATUS') == 410:
+            state['EXPIRED'] = False
+            state['VERSION'] = None
+            if 'resync' in kwargs.keys() and kwargs['resync'] is not None:
+                state['VERSION'] = kwargs['resync']()
+            continue
+        if out['RESULT'] > 0 or out['STOPPED']:
+            return(out)
+        if deadline is not None and time.time() >= deadline:
+            out['RESULT'] = 1
+            out['TIMEDOUT'] = True
+            out['STDERR'].append("Timed out after " + str(kwargs['timeout']) + " seconds")
+            return(out)
+        if time.time() - started < reconnectdelay:
+            time.sleep(reconnectdelay)
+
+
+def logs(kubeconfig, podname, callback, **kwargs):
+    if not usable(kubeconfig, ['pod']):
+        return(None)
+    query = {}
+    if 'follow' in kwargs.keys() and kwargs['follow']:
+        query['follow'] = 'true'
+    return(stream(collectionpath('pod', name=podname) + '/log?' + urllib.urlencode(query), callback))
+
+
+def closeall():
+    for conn in connections:
+        conn.close()
+    del connections[:]
+    local.connection = None
+    if tempdir is not None:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+
+atexit.register(closeall)
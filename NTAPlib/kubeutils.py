@@ -0,0 +1,534 @@
+#! /usr/bin/python
+###########################################################################
+# (c) 2019 NetApp Inc. (NetApp), All Rights Reserved
+#
+# NetApp disclaims all warranties, excepting NetApp shall provide
+# support of unmodified software pursuant to a valid, separate,
+# purchased support agreement.  No distribution or modification of
+# this software is permitted by NetApp, except under separate
+# written agreement, which may be withheld at NetApp's sole
+# discretion.
+#
+# THIS SOFTWARE IS PROVIDED BY NETAPP "AS IS" AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL NETAPP BE LIABLE FOR ANY DIRECT,
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# Created by Jeffrey Steiner, jfs@netapp.com
+#
+###########################################################################
+import json
+import time
+import threading
+import Queue
+import kubeapi
+from doprocess import doprocess
+from doprocess import doprocesses
+
+kubeenv = {'KUBECONFIG': '/etc/kubernetes/admin.conf'}
+apilock = threading.Lock()
+kindmap = {'container': 'Pod',
+           'HAservice': 'Deployment',
+           'dbf': 'PersistentVolumeClaim',
+           'log': 'PersistentVolumeClaim'}
+allkinds = ['pod', 'deployment', 'pvc']
+notfound = ['NotFound', 'not found', 'No resources found']
+managedselector = 'ntap-dbaas-managed=True'
+unmanagedselector = '!ntap-dbaas-managed'
+trimmedcolumns = [['kind'],
+                  ['metadata', 'name'],
+                  ['metadata', 'deletionTimestamp'],
+                  ['metadata', 'labels', 'ntap-dbaas-HA'],
+                  ['metadata', 'annotations', 'ntap-dbaas-managed'],
+                  ['metadata', 'annotations', 'ntap-dbaas-uuid'],
+                  ['metadata', 'annotations', 'ntap-dbaas-type'],
+                  ['metadata', 'annotations', 'ntap-dbaas-db'],
+                  ['metadata', 'annotations', 'ntap-dbaas-version'],
+                  ['metadata', 'annotations', 'ntap-dbaas-sid'],
+                  ['metadata', 'annotations', 'ntap-dbaas-pdb'],
+                  ['metadata', 'annotations', 'ntap-dbaas-pool'],
+                  ['metadata', 'annotations', 'ntap-dbaas-pooltime'],
+                  ['metadata', 'annotations', 'ntap-dbaas-poolsize'],
+                  ['metadata', 'annotations', 'ntap-dbaas-poolmaxage'],
+                  ['spec', 'nodeName'],
+                  ['status', 'phase'],
+                  ['status', 'podIP'],
+                  ['status', 'availableReplicas']]
+
+
+def getfield(jsondict, fields):
+    nextiter = jsondict
+    for item in fields:
+        if type(nextiter) is not dict or item not in nextiter:
+            return(None)
+        else:
+            nextiter = nextiter[item]
+    return(nextiter)
+
+
+def newinventory():
+    inventory = {'RESULT': 0, 'BYUUID': {}, 'BYTYPE': {}, 'BYNAME': {}, 'DUPLICATES': set()}
+    for objtype in kindmap.keys():
+        inventory['BYTYPE'][objtype] = {}
+    for kind in set(kindmap.values()):
+        inventory['BYNAME'][kind] = {}
+    return(inventory)
+
+
+def trimmedoutput():
+    columns = []
+    for x in range(0, len(trimmedcolumns)):
+        columns.append('{.' + '.'.join(trimmedcolumns[x]) + '}')
+    return('-o jsonpath={range.items[*]}' + '{"\\t"}'.join(columns) + '{"\\n"}{end}')
+
+
+def trimmeditem(line):
+    values = line.split("\t")
+    if len(values) > len(trimmedcolumns):
+        return(None)
+    values = values + [''] * (len(trimmedcolumns) - len(values))
+    item = {}
+    for x in range(0, len(trimmedcolumns)):
+        if len(values[x]) == 0:
+            continue
+        nextiter = item
+        for field in trimmedcolumns[x][:-1]:
+            nextiter = nextiter.setdefault(field, {})
+        if trimmedcolumns[x][-1] == 'availableReplicas' and values[x].isdigit():
+            nextiter[trimmedcolumns[x][-1]] = int(values[x])
+        else:
+            nextiter[trimmedcolumns[x][-1]] = values[x]
+    if 'kind' not in item.keys() or getfield(item, ['metadata', 'name']) is None:
+        return(None)
+    return(item)
+
+
+def objrecord(item):
+    annotations = getfield(item, ['metadata', 'annotations'])
+    record = {'name': item['metadata']['name'], 'kind': item['kind']}
+    for key in annotations.keys():
+        if key.startswith('ntap-dbaas-'):
+            record[key[11:]] = annotations[key]
+    if item['kind'] == 'Pod':
+        record['status'] = getfield(item, ['status', 'phase'])
+        record['IP'] = getfield(item, ['status', 'podIP'])
+        record['node'] = getfield(item, ['spec', 'nodeName'])
+        record['HA'] = getfield(item, ['metadata', 'labels', 'ntap-dbaas-HA'])
+    elif item['kind'] == 'PersistentVolumeClaim':
+        record['status'] = getfield(item, ['status', 'phase'])
+    elif item['kind'] == 'Deployment':
+        if getfield(item, ['status', 'availableReplicas']) == 1:
+            record['status'] = "Healthy"
+        else:
+            record['status'] = "Unknown"
+    return(record)
+
+
+def indexobject(inventory, item):
+    if getfield(item, ['metadata', 'annotations', 'ntap-dbaas-managed']) != 'True':
+        return(None)
+    if item.get('kind') not in inventory['BYNAME'].keys():
+        return(None)
+    return(indexrecord(inventory, objrecord(item)))
+
+
+def indexrecord(inventory, record):
+    inventory['BYNAME'][record['kind']][record['name']] = record
+    objuuid = record.get('uuid')
+    objtype = record.get('type')
+    if objuuid is None or objtype not in inventory['BYTYPE'].keys():
+        return(record)
+    if objuuid in inventory['BYTYPE'][objtype] and \
+       not inventory['BYTYPE'][objtype][objuuid]['name'] == record['name']:
+        inventory['DUPLICATES'].add((objtype, objuuid))
+    inventory['BYTYPE'][objtype][objuuid] = record
+    if objuuid not in inventory['BYUUID']:
+        inventory['BYUUID'][objuuid] = {}
+    inventory['BYUUID'][objuuid][objtype] = record
+    return(record)
+
+
+def mergeinventory(inventory, other):
+    count = 0
+    for kind in other['BYNAME'].keys():
+        for name in other['BYNAME'][kind].keys():
+            indexrecord(inventory, other['BYNAME'][kind][name])
+            count += 1
+    inventory['DUPLICATES'].update(other['DUPLICATES'])
+    inventory.pop('VERSIONS', None)
+    return(count)
+
+
+def unindexobject(inventory, kind, name):
+    if kind not in inventory['BYNAME'].keys() or name not in inventory['BYNAME'][kind]:
+        return(None)
+    record = inventory['BYNAME'][kind].pop(name)
+    objuuid = record.get('uuid')
+    objtype = record.get('type')
+    if objuuid is None or objtype not in inventory['BYTYPE'].keys():
+        return(record)
+    if objuuid in inventory['BYTYPE'][objtype] and \
+       inventory['BYTYPE'][objtype][objuuid]['name'] == name:
+        del inventory['BYTYPE'][objtype][objuuid]
+        del inventory['BYUUID'][objuuid][objtype]
+        if len(inventory['BYUUID'][objuuid]) == 0:
+            del inventory['BYUUID'][objuuid]
+    return(record)
+
+
+def applyevent(inventory, eventtype, item):
+    kind = item.get('kind')
+    name = getfield(item, ['metadata', 'name'])
+    if kind not in inventory['BYNAME'].keys() or name is None:
+        return([])
+    previous = unindexobject(inventory, kind, name)
+    if eventtype == 'DELETED':
+        record = None
+    else:
+        record = indexobject(inventory, item)
+    if previous == record:
+        return([])
+    changed = []
+    for entry in [previous, record]:
+        if entry is not None and entry.get('uuid') is not None and entry['uuid'] not in changed:
+            changed.append(entry['uuid'])
+    return(changed)
+
+
+def watchinventory(inventory, callback, **kwargs):
+    if 'kinds' in kwargs.keys():
+        kinds = kwargs['kinds']
+    else:
+        kinds = allkinds
+    decoder = json.JSONDecoder()
+    commands = []
+
+    def watcher():
+        state = {'buffer': ''}
+
+        def nextline(line):
+            objs, state['buffer'] = nextjson(state['buffer'] + line + "\n", decoder)
+            for obj in objs:
+                if 'type' not in obj.keys() or 'object' not in obj.keys():
+                    continue
+                kind = obj['object'].get('kind')
+                name = getfield(obj['object'], ['metadata', 'name'])
+                previous = inventory['BYNAME'].get(kind, {}).get(name)
+                changed = applyevent(inventory, obj['type'], obj['object'])
+                if len(changed) > 0:
+                    record = inventory['BYNAME'].get(kind, {}).get(name)
+                    if callback(changed, previous, record) is False:
+                        return(False)
+        return(nextline)
+
+    if 'selector' in kwargs.keys():
+        selector = kwargs['selector']
+    else:
+        selector = None
+
+    def resync(kind, nextline):
+        def relist():
+            out = kubeapi.listobjects(kubeenv['KUBECONFIG'], [kind], selector=selector)
+            if out is None or out['RESULT'] > 0:
+                return(None)
+            names = set()
+            for item in out['ITEMS']:
+                names.add(getfield(item, ['metadata', 'name']))
+                nextline(json.dumps({'type': 'MODIFIED', 'object': item}))
+            kindname = kubeapi.resource(kind)[0]
+            for name in inventory['BYNAME'].get(kindname, {}).keys():
+                if name not in names:
+                    nextline(json.dumps({'type': 'DELETED', 'object': {'kind': kindname, 'metadata': {'name': name}}}))
+            return(out['VERSIONS'].get(kind))
+        return(relist)
+
+    if kubeapi.usable(kubeenv['KUBECONFIG'], kinds):
+        versions = inventory.get('VERSIONS', {})
+        tasks = []
+        for kind in kinds:
+            nextline = watcher()
+            tasks.append((apiwatch, [kind, nextline], {'selector': selector, 'version': versions.get(kind),
+                                                       'resync': resync(kind, nextline)}))
+        results = runparallel(tasks, workers=len(tasks))
+        if None not in results:
+            return(results)
+    if selector is not None:
+        selector = ' -l ' + selector
+    else:
+        selector = ''
+    for kind in kinds:
+        commands.append(('kubectl get ' + kind + selector + ' --watch --output-watch-events -o json',
+                         {'env': kubeenv, 'stdoutcallback': watcher(), 'keeplines': 20}))
+    return(doprocesses(commands, limit=len(commands)))
+
+
+def apiwatch(kind, callback, **kwargs):
+
+    def locked(line):
+        with apilock:
+            return(callback(line))
+
+    if 'resync' in kwargs.keys() and kwargs['resync'] is not None:
+        relist = kwargs['resync']
+
+        def lockedrelist():
+            with apilock:
+                return(relist())
+        kwargs['resync'] = lockedrelist
+
+    return(kubeapi.watch(kubeenv['KUBECONFIG'], kind, locked, **kwargs))
+
+
+def getinventory(**kwargs):
+    if 'kinds' in kwargs.keys():
+        kinds = kwargs['kinds']
+    else:
+        kinds = allkinds
+    if 'selector' in kwargs.keys():
+        selector = kwargs['selector']
+    else:
+        selector = None
+    inventory = newinventory()
+    out = kubeapi.listobjects(kubeenv['KUBECONFIG'], kinds, selector=selector,
+                              callback=lambda item: indexobject(inventory, item))
+    if out is not None:
+        if out['RESULT'] > 0:
+            return({'RESULT': 1, 'STDOUT': [], 'STDERR': ["Unable to enumerate " + ','.join(kinds) + " objects"] + out['STDERR']})
+        inventory['VERSIONS'] = out['VERSIONS']
+        return(inventory)
+    cmd = "kubectl get " + ','.join(kinds)
+    if selector is not None:
+        cmd = cmd + " -l " + selector
+    out = doprocess(cmd + " " + trimmedoutput(), env=kubeenv)
+    if out['RESULT'] > 0:
+        return({'RESULT': 1, 'STDOUT': [], 'STDERR': ["Unable to enumerate " + ','.join(kinds) + " objects"] + out['STDERR']})
+    for line in out['STDOUT']:
+        if len(line) == 0:
+            continue
+        item = trimmeditem(line)
+        if item is None:
+            return({'RESULT': 1, 'STDOUT': [], 'STDERR': ["Unable to parse output of " + cmd, line]})
+        indexobject(inventory, item)
+    return(inventory)
+
+
+def existingnames(objects):
+    found = set()
+    if kubeapi.usable(kubeenv['KUBECONFIG'], [kind for kind, name in objects]):
+        for kind, name in objects:
+            out = kubeapi.getobject(kubeenv['KUBECONFIG'], kind, name)
+            if out is None:
+                found = set()
+                break
+            elif out['RESULT'] == 0:
+                found.add((kind.lower(), name))
+            elif not out['STATUS'] == 404:
+                return({'RESULT': 1, 'NAMES': found, 'STDERR': out['STDERR']})
+        else:
+            return({'RESULT': 0, 'NAMES': found, 'STDERR': []})
+    for x in range(0, len(objects), 100):
+        names = [kind.lower() + '/' + name for kind, name in objects[x:x + 100]]
+        out = doprocess('kubectl get ' + ' '.join(names) + ' -o name --ignore-not-found', env=kubeenv)
+        if out['RESULT'] > 0 and not isnotfound(out['STDERR']):
+            return({'RESULT': 1, 'NAMES': found, 'STDERR': out['STDERR']})
+        for line in out['STDOUT']:
+            if '/' in line:
+                kind, name = line.strip().split('/', 1)
+                found.add((kind.split('.')[0].lower(), name))
+    return({'RESULT': 0, 'NAMES': found, 'STDERR': []})
+
+
+def objstatus(item):
+    if getfield(item, ['metadata', 'deletionTimestamp']) is not None:
+        return('Terminating')
+    elif item.get('kind') == 'Deployment':
+        return(str(getfield(item, ['status', 'availableReplicas'])) + ' available')
+    else:
+        return(getfield(item, ['status', 'phase']))
+
+
+def isnotfound(lines):
+    for line in lines:
+        for item in notfound:
+            if item in line:
+                return(True)
+    return(False)
+
+
+def nextjson(buffer, decoder):
+    objs = []
+    while True:
+        buffer = buffer.lstrip()
+        if len(buffer) == 0:
+            break
+        try:
+            obj, end = decoder.raw_decode(buffer)
+        except ValueError:
+            break
+        objs.append(obj)
+        buffer = buffer[end:]
+    return(objs, buffer)
+
+
+def waitfordelete(kind, name, **kwargs):
+    if 'timeout' in kwargs.keys():
+        timeout = kwargs['timeout']
+    else:
+        timeout = 60
+    if 'callback' in kwargs.keys():
+        callback = kwargs['callback']
+    else:
+        callback = None
+    starttime = time.time()
+    deadline = starttime + timeout
+    decoder = json.JSONDecoder()
+    transitions = []
+    state = {'buffer': '', 'deleted': False}
+
+    def nextline(line):
+        objs, state['buffer'] = nextjson(state['buffer'] + line + "\n", decoder)
+        for obj in objs:
+            if 'type' in obj.keys() and 'object' in obj.keys():
+                eventtype = obj['type']
+                obj = obj['object']
+            else:
+                eventtype = None
+            if eventtype == 'DELETED':
+                status = 'Deleted'
+                state['deleted'] = True
+            else:
+                status = objstatus(obj)
+            if len(transitions) == 0 or not transitions[-1] == status:
+                transitions.append(status)
+                if callback is not None:
+                    callback(name, status)
+        return(not state['deleted'])
+
+    out = kubeapi.watch(kubeenv['KUBECONFIG'], kind, nextline, name=name, timeout=timeout)
+    if out is None:
+        out = doprocess('kubectl get ' + kind + ' ' + name + ' --watch --output-watch-events -o json',
+                        env=kubeenv, stdoutcallback=nextline, timeout=timeout)
+    deleted = state['deleted']
+    timedout = out['TIMEDOUT']
+    stderr = out['STDERR']
+    if out['RESULT'] == 1 and len(out['STDERR']) == 0 and not deleted:
+        stderr = ["Unable to run kubectl get " + kind + " " + name + " --watch"]
+    if not deleted and not timedout:
+        if isnotfound(stderr):
+            deleted = True
+        elif 'unknown flag' in ' '.join(stderr):
+            remaining = int(deadline - time.time()) + 1
+            out = doprocess("kubectl wait --for=delete " + kind + "/" + name + " --timeout=" + str(remaining) + "s",
+                            env=kubeenv)
+            if out['RESULT'] == 0 or isnotfound(out['STDERR']):
+                deleted = True
+            else:
+                stderr = out['STDERR']
+    elapsed = time.time() - starttime
+    if deleted:
+        return({'RESULT': 0, 'STDOUT': transitions, 'STDERR': [], 'ELAPSED': elapsed})
+    elif timedout:
+        return({'RESULT': 1, 'STDOUT': transitions, 'STDERR': ["Timed out waiting for deletion of " + kind + " " + name], 'ELAPSED': elapsed})
+    else:
+        return({'RESULT': 1, 'STDOUT': transitions, 'STDERR': stderr, 'ELAPSED': elapsed})
+
+
+def deleteobject(kind, name, **kwargs):
+    starttime = time.time()
+    out = kubeapi.deleteobject(kubeenv['KUBECONFIG'], kind, name)
+    if out is None:
+        out = doprocess('kubectl delete ' + kind + ' ' + name + ' --wait=false', env=kubeenv)
+    if out['RESULT'] > 0 and not isnotfound(out['STDERR']):
+        return({'RESULT': 1, 'STDOUT': [], 'STDERR': out['STDERR'], 'ELAPSED': time.time() - starttime})
+    out = waitfordelete(kind, name, **kwargs)
+    out['ELAPSED'] = time.time() - starttime
+    return(out)
+
+
+def patchobject(kind, name, patch, **kwargs):
+    if 'patchtype' in kwargs.keys():
+        patchtype = kwargs['patchtype']
+    else:
+        patchtype = 'merge'
+    body = json.dumps(patch, separators=(',', ':'))
+    out = kubeapi.patchobject(kubeenv['KUBECONFIG'], kind, name, body, patchtype=patchtype)
+    if out is not None:
+        return(out)
+    # doprocess splits the command on spaces, so spaces inside JSON strings are escaped
+    return(doprocess('kubectl patch ' + kind + ' ' + name + ' --type=' + patchtype + ' -p ' +
+                     body.replace(' ', '\\u0020'), env=kubeenv))
+
+
+def runparallel(tasks, **kwargs):
+    if 'workers' in kwargs.keys():
+        workers = kwargs['workers']
+    else:
+        workers = 4
+    results = [None] * len(tasks)
+    pending = Queue.Queue()
+    for index in range(0, len(tasks)):
+        pending.put(index)
+
+    def worker():
+        while True:
+            try:
+                index = pending.get_nowait()
+            except Queue.Empty:
+                return
+            function, args, taskkwargs = tasks[index]
+            try:
+                results[index] = function(*args, **taskkwargs)
+            except Exception as e:
+                results[index] = {'RESULT': 1, 'STDOUT': [], 'STDERR': [str(e)], 'ELAPSED': 0}
+
+    threads = []
+    for x in range(0, min(workers, len(tasks))):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(1)
+    return(results)
+
+
+def applymanifest(yamltext):
+    if type(yamltext) is unicode:
+        yamltext = yamltext.encode('utf-8')
+    out = kubeapi.applymanifest(kubeenv['KUBECONFIG'], yamltext)
+    if out is not None:
+        return(out)
+    out = doprocess('kubectl apply -f -', input=yamltext, env=kubeenv)
+    objects = []
+    for line in out['STDOUT']:
+        fields = line.split()
+        if len(fields) >= 2 and '/' in fields[0]:
+            kind, name = fields[0].split('/', 1)
+            objects.append((kind, name, ' '.join(fields[1:])))
+    return({'RESULT': out['RESULT'], 'OBJECTS': objects, 'STDOUT': out['STDOUT'], 'STDERR': out['STDERR']})
+
+
+def podlogs(podname, **kwargs):
+    if 'follow' in kwargs.keys():
+        follow = kwargs['follow']
+    else:
+        follow = False
+    if 'callback' in kwargs.keys():
+        callback = kwargs['callback']
+    else:
+        callback = None
+    out = kubeapi.logs(kubeenv['KUBECONFIG'], podname, callback, follow=follow)
+    if out is not None:
+        return(out)
+    cmd = 'kubectl logs ' + podname
+    if follow:
+        cmd = cmd + ' -f'
+    return(doprocess(cmd, env=kubeenv, stdoutcallback=callback, trapsignals=True, keeplines=100))
@@ -26,24 +26,90 @@
 ###########################################################################
 import os
 import pwd
+import grp
+import json
 from doprocess import doprocess
 
 oratablocation = '/etc/oratab'
+cachelocation = os.environ.get('NTAP_ORACACHE')
+registry = {'MTIME': None, 'SIDS': {}, 'HOMES': {}, 'USERS': {}}
 
 
-def getoraclehome(localsid):
+def loadcache():
+    if cachelocation is None or not os.path.isfile(cachelocation):
+        return(False)
+    try:
+        cached = json.load(open(cachelocation, 'r'))
+    except:
+        return(False)
+    if not cached.get('MTIME') == oratabmtime():
+        return(False)
+    registry['MTIME'] = cached['MTIME']
+    for key in ['SIDS', 'HOMES', 'USERS']:
+        registry[key] = {}
+        for item in cached[key].keys():
+            registry[key][str(item)] = cached[key][item]
+    return(True)
+
+
+def savecache():
+    if cachelocation is None:
+        return
+    try:
+        tempname = cachelocation + '.' + str(os.getpid())
+        open(tempname, 'w').write(json.dumps(registry))
+        os.rename(tempname, cachelocation)
+    except:
+        pass
+
+
+def oratabmtime():
+    try:
+        return(os.stat(oratablocation).st_mtime)
+    except:
+        return(-1)
+
+
+def refreshregistry():
+    mtime = oratabmtime()
+    if registry['MTIME'] == mtime:
+        return
+    if loadcache():
+        return
+    registry['MTIME'] = mtime
+    registry['SIDS'] = {}
+    registry['HOMES'] = {}
+    registry['USERS'] = {}
     try:
         oratablines = open(oratablocation, 'r').read().splitlines()
     except:
-        return(None)
+        return
     for line in oratablines:
         oratabfields = line.split(':')
-        if oratabfields[0] == localsid:
-            return(oratabfields[1])
+        if len(oratabfields) > 1 and oratabfields[0] not in registry['SIDS'].keys():
+            registry['SIDS'][oratabfields[0]] = oratabfields[1]
+    savecache()
+
+
+def getoraclehome(localsid):
+    refreshregistry()
+    if localsid in registry['SIDS'].keys():
+        return(str(registry['SIDS'][localsid]))
     return(None)
 
 
+def gethomeinfo(oraclehome):
+    refreshregistry()
+    if oraclehome not in registry['HOMES'].keys():
+        registry['HOMES'][oraclehome] = {'USER': None, 'BASE': None}
+    return(registry['HOMES'][oraclehome])
+
+
 def getoraclebase(oraclehome):
+    homeinfo = gethomeinfo(oraclehome)
+    if homeinfo['BASE'] is not None:
+        return(str(homeinfo['BASE']))
+
     oracleuser = getoracleuser(oraclehome)
     if oracleuser is None:
         return(None)
@@ -54,6 +120,8 @@ def getoraclebase(oraclehome):
 
     if out['RESULT'] == 0:
         if os.path.exists(out['STDOUT'][-1]):
+            homeinfo['BASE'] = out['STDOUT'][-1]
+            savecache()
             return(out['STDOUT'][-1])
         else:
             return(None)
@@ -62,9 +130,44 @@ def getoraclebase(oraclehome):
 
 
 def getoracleuser(oraclehome):
+    homeinfo = gethomeinfo(oraclehome)
+    if homeinfo['USER'] is not None:
+        return(str(homeinfo['USER']))
     try:
         oracleuid = os.stat(oraclehome).st_uid
         oracleuser = pwd.getpwuid(oracleuid).pw_name
-        return(oracleuser)
     except:
         return(None)
+    homeinfo['USER'] = oracleuser
+    savecache()
+    return(oracleuser)
+
+
+def getuserids(user):
+    refreshregistry()
+    if user in registry['USERS'].keys():
+        return(registry['USERS'][user])
+    userinfo = pwd.getpwnam(user)
+    grouplist = [userinfo.pw_gid]
+    for item in grp.getgrall():
+        if user in item[3] and item[2] not in grouplist:
+            grouplist.append(item[2])
+    registry['USERS'][user] = {'UID': userinfo.pw_uid, 'GID': userinfo.pw_gid, 'GROUPS': grouplist}
+    savecache()
+    return(registry['USERS'][user])
+
+
+def getoracleenv(localsid):
+    oraclehome = getoraclehome(localsid)
+    if oraclehome is None:
+        return(None)
+    oracleuser = getoracleuser(oraclehome)
+    if oracleuser is None:
+        return(None)
+    ids = getuserids(oracleuser)
+    return({'HOME': oraclehome,
+            'BASE': getoraclebase(oraclehome),
+            'USER': oracleuser,
+            'UID': ids['UID'],
+            'GID': ids['GID'],
+            'GROUPS': ids['GROUPS']})
@@ -0,0 +1,146 @@
+#! /usr/bin/python
+###########################################################################
+# (c) 2019 NetApp Inc. (NetApp), All Rights Reserved
+#
+# NetApp disclaims all warranties, excepting NetApp shall provide
+# support of unmodified software pursuant to a valid, separate,
+# purchased support agreement.  No distribution or modification of
+# this software is permitted by NetApp, except under separate
+# written agreement, which may be withheld at NetApp's sole
+# discretion.
+#
+# THIS SOFTWARE IS PROVIDED BY NETAPP "AS IS" AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL NETAPP BE LIABLE FOR ANY DIRECT,
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# Created by Jeffrey Steiner, jfs@netapp.com
+#
+###########################################################################
+import os
+import time
+import socket
+import threading
+import BaseHTTPServer
+import dosqlplus
+
+port = int(os.environ.get('NTAP_PROBEPORT', '8080'))
+listenerport = 1521
+interval = 10
+ttl = 60
+maxfailures = 3
+state = {'PHASE': 'starting',
+         'OPEN_MODE': None,
+         'LISTENER': False,
+         'CHECKED': 0,
+         'SINCE': time.time(),
+         'FAILURES': 0}
+wakeup = threading.Event()
+checker = {'SESSION': None, 'SID': None, 'HOME': None, 'BASE': None}
+
+
+def setphase(phase):
+    state['PHASE'] = phase
+    state['CHECKED'] = 0
+    state['SINCE'] = time.time()
+    wakeup.set()
+
+
+def listenerup():
+    try:
+        sock = socket.create_connection(('127.0.0.1', listenerport), 1)
+        sock.close()
+        return(True)
+    except socket.error:
+        return(False)
+
+
+def openmode():
+    if checker['SESSION'] is None:
+        oracle = dosqlplus.resolveoracle(checker['SID'], home=checker['HOME'], base=checker['BASE'])
+        if oracle['RESULT'] > 0:
+            return(None)
+        checker['SESSION'] = dosqlplus.SqlplusSession(checker['SID'], oracle['HOME'], oracle['BASE'], oracle['PREEXEC'])
+    query = checker['SESSION'].query('select open_mode from v$database')
+    rows = query.rows()
+    if query.errors or len(rows) == 0:
+        checker['SESSION'].close()
+        return(None)
+    return(rows[0]['OPEN_MODE'])
+
+
+def refresh():
+    mode = openmode()
+    state['OPEN_MODE'] = mode
+    state['LISTENER'] = listenerup()
+    if mode is None:
+        state['FAILURES'] += 1
+    else:
+        state['FAILURES'] = 0
+    state['CHECKED'] = time.time()
+
+
+def refresher():
+    while True:
+        wakeup.clear()
+        if state['PHASE'] == 'running':
+            refresh()
+        wakeup.wait(interval)
+
+
+def ready():
+    return(state['PHASE'] == 'running' and time.time() - state['CHECKED'] < ttl
+           and state['OPEN_MODE'] == 'READ WRITE' and state['LISTENER'])
+
+
+def alive():
+    return(not state['PHASE'] == 'running' or
+           (state['FAILURES'] < maxfailures and time.time() - max(state['CHECKED'], state['SINCE']) < ttl))
+
+
+class ProbeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/ready':
+            healthy = ready()
+        elif self.path == '/healthz':
+            healthy = alive()
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = state['PHASE'] + ' ' + str(state['OPEN_MODE']) + "\n"
+        if healthy:
+            self.send_response(200)
+        else:
+            self.send_response(503)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(sid, **kwargs):
+    checker['SID'] = sid
+    checker['HOME'] = kwargs.get('home')
+    checker['BASE'] = kwargs.get('base')
+    try:
+        server = BaseHTTPServer.HTTPServer(('', port), ProbeHandler)
+    except socket.error:
+        return(None)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    thread = threading.Thread(target=refresher)
+    thread.daemon = True
+    thread.start()
+    return(server)
@@ -0,0 +1,218 @@
+#! /usr/bin/python
+###########################################################################
+# (c) 2019 NetApp Inc. (NetApp), All Rights Reserved
+#
+# NetApp disclaims all warranties, excepting NetApp shall provide
+# support of unmodified software pursuant to a valid, separate,
+# purchased support agreement.  No distribution or modification of
+# this software is permitted by NetApp, except under separate
+# written agreement, which may be withheld at NetApp's sole
+# discretion.
+#
+# THIS SOFTWARE IS PROVIDED BY NETAPP "AS IS" AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL NETAPP BE LIABLE FOR ANY DIRECT,
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# Created by Jeffrey Steiner, jfs@netapp.com
+#
+###########################################################################
+import os
+import sys
+import json
+import time
+import errno
+import atexit
+import traceback
+import userio
+
+profiledir = os.environ.get('NTAP_PROFILE')
+internalfiles = ['doprocess.py', 'dosqlplus.py', 'kubeapi.py', 'profiler.py', 'threading.py']
+events = []
+started = time.time()
+
+
+def enable(path):
+    global profiledir
+    profiledir = path
+
+
+def enabled():
+    return(profiledir is not None)
+
+
+def childenv():
+    if profiledir is None:
+        return({})
+    return({'NTAP_PROFILE': profiledir})
+
+
+def caller():
+    for filename, line, function, text in reversed(traceback.extract_stack()[:-1]):
+        if os.path.basename(filename) not in internalfiles:
+            return(os.path.basename(filename) + ':' + str(line) + '(' + function + ')')
+    return('unknown')
+
+
+def reap(process, **kwargs):
+    if kwargs.get('nohang', False):
+        flags = os.WNOHANG
+    else:
+        flags = 0
+    while process.returncode is None:
+        try:
+            pid, status, usage = os.wait4(process.pid, flags)
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                continue
+            process.wait()
+            return(None)
+        if pid == 0:
+            return(None)
+        if os.WIFSIGNALED(status):
+            process.returncode = -os.WTERMSIG(status)
+        else:
+            process.returncode = os.WEXITSTATUS(status)
+        return(usage)
+    return(None)
+
+
+def newevent(command, kind, **kwargs):
+    now = time.time()
+    event = {'command': command,
+             'kind': kind,
+             'tool': kwargs.get('tool', os.path.basename(command.split(' ')[0])),
+             'caller': caller(),
+             'user': kwargs.get('user'),
+             'pid': kwargs.get('pid'),
+             'start': kwargs.get('start', now),
+             'bytesin': kwargs.get('bytesin', 0),
+             'bytesout': kwargs.get('bytesout', 0),
+             'result': kwargs.get('result'),
+             'utime': None,
+             'stime': None,
+             'maxrss': None}
+    event['wall'] = kwargs.get('end', now) - event['start']
+    if kwargs.get('usage') is not None:
+        event['utime'] = kwargs['usage'].ru_utime
+        event['stime'] = kwargs['usage'].ru_stime
+        event['maxrss'] = kwargs['usage'].ru_maxrss
+    events.append(event)
+    return(event)
+
+
+def recordprocess(command, **kwargs):
+    if profiledir is None:
+        return(None)
+    return(newevent(command, 'process', **kwargs))
+
+
+def recordexchange(command, **kwargs):
+    if profiledir is None:
+        return(None)
+    if 'tool' not in kwargs.keys():
+        kwargs['tool'] = 'sqlplus'
+    return(newevent(command, 'exchange', **kwargs))
+
+
+def humanbytes(value):
+    for unit in ['B', 'K', 'M', 'G']:
+        if value < 1024:
+            return(str(value) + unit)
+        value = value / 1024
+    return(str(value) + 'T')
+
+
+def aggregate(key):
+    totals = {}
+    for event in events:
+        group = key(event)
+        if group not in totals.keys():
+            totals[group] = {'count': 0, 'wall': 0.0, 'cpu': 0.0, 'maxrss': 0, 'bytesin': 0, 'bytesout': 0,
+                             'failed': 0}
+        total = totals[group]
+        total['count'] += 1
+        total['wall'] += event['wall']
+        if event['utime'] is not None:
+            total['cpu'] += event['utime'] + event['stime']
+            total['maxrss'] = max(total['maxrss'], event['maxrss'])
+        total['bytesin'] += event['bytesin']
+        total['bytesout'] += event['bytesout']
+        if event['result'] is not None and not event['result'] == 0:
+            total['failed'] += 1
+    return(sorted(totals.items(), key=lambda x: x[1]['wall'], reverse=True))
+
+
+def report():
+    processes = len([event for event in events if event['kind'] == 'process'])
+    lines = ['Process profile for ' + os.path.basename(sys.argv[0]) + ' pid ' + str(os.getpid()) + ': ' +
+             str(processes) + ' processes in %.1fs' % (time.time() - started), '']
+    grid = [['Tool', 'Count', 'Wall', 'CPU', 'Max RSS', 'Bytes in', 'Bytes out', 'Failed']]
+    for group, total in aggregate(lambda x: x['tool'] + (' exchange' if x['kind'] == 'exchange' else '')):
+        grid.append([group, str(total['count']), '%.2fs' % total['wall'], '%.2fs' % total['cpu'],
+                     humanbytes(total['maxrss'] * 1024), humanbytes(total['bytesin']),
+                     humanbytes(total['bytesout']), str(total['failed'])])
+    lines.extend(userio.gridlines(grid))
+    lines.append('')
+    grid = [['Caller', 'Count', 'Wall', 'CPU']]
+    for group, total in aggregate(lambda x: x['caller'])[:20]:
+        grid.append([group, str(total['count']), '%.2fs' % total['wall'], '%.2fs' % total['cpu']])
+    lines.extend(userio.gridlines(grid))
+    return(lines)
+
+
+def chrometrace():
+    pid = os.getpid()
+    traceevents = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                    'args': {'name': os.path.basename(sys.argv[0]) + ' ' + str(pid)}}]
+    for event in events:
+        args = {'command': event['command'],
+                'caller': event['caller'],
+                'user': event['user'],
+                'result': event['result'],
+                'bytesin': event['bytesin'],
+                'bytesout': event['bytesout']}
+        if event['utime'] is not None:
+            args['utime'] = round(event['utime'], 6)
+            args['stime'] = round(event['stime'], 6)
+            args['maxrss'] = event['maxrss']
+        traceevents.append({'name': event['command'][:80],
+                            'cat': event['tool'] + ',' + event['kind'],
+                            'ph': 'X',
+                            'ts': int(event['start'] * 1000000),
+                            'dur': int(event['wall'] * 1000000),
+                            'pid': pid,
+                            'tid': event['pid'] or 0,
+                            'args': args})
+    return({'traceEvents': traceevents, 'displayTimeUnit': 'ms'})
+
+
+def dump():
+    if profiledir is None or len(events) == 0:
+        return(None)
+    basename = os.path.join(profiledir, os.path.basename(sys.argv[0]) + '-' + str(os.getpid()))
+    lines = report()
+    try:
+        if not os.path.isdir(profiledir):
+            os.makedirs(profiledir)
+        fh = open(basename + '.trace.json', 'w')
+        json.dump(chrometrace(), fh)
+        fh.close()
+        fh = open(basename + '.txt', 'w')
+        fh.write("\n".join(lines) + "\n")
+        fh.close()
+    except (IOError, OSError) as e:
+        sys.stderr.write("Unable to write profile to " + profiledir + ": " + str(e) + "\n")
+        return(None)
+    sys.stderr.write("\n".join(lines + ['', 'Chrome trace written to ' + basename + '.trace.json']) + "\n")
+    return(basename)
+
+
+atexit.register(dump)
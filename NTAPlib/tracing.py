@@ -0,0 +1,176 @@
+#! /usr/bin/python
+###########################################################################
+# (c) 2019 NetApp Inc. (NetApp), All Rights Reserved
+#
+# NetApp disclaims all warranties, excepting NetApp shall provide
+# support of unmodified software pursuant to a valid, separate,
+# purchased support agreement.  No distribution or modification of
+# this software is permitted by NetApp, except under separate
+# written agreement, which may be withheld at NetApp's sole
+# discretion.
+#
+# THIS SOFTWARE IS PROVIDED BY NETAPP "AS IS" AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL NETAPP BE LIABLE FOR ANY DIRECT,
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# Created by Jeffrey Steiner, jfs@netapp.com
+#
+###########################################################################
+import os
+import json
+import time
+import random
+import atexit
+import shutil
+
+tracefile = None
+traceparent = None
+tracedir = None
+tracename = None
+stack = []
+completed = []
+
+
+def newid():
+    return(''.join(random.choice('0123456789abcdef') for i in range(16)))
+
+
+def settrace(sid, script):
+    global tracefile
+    global traceparent
+    global tracedir
+    global tracename
+    if 'NTAP_TRACEFILE' in os.environ.keys():
+        tracefile = os.environ['NTAP_TRACEFILE']
+        traceparent = os.environ.get('NTAP_TRACEPARENT')
+        tracedir = None
+    else:
+        tracefile = '/tmp/ntap-trace-' + script + '-' + str(os.getpid()) + '.jsonl'
+        traceparent = None
+        tracedir = '/logs/' + sid + '/trace'
+        tracename = script + '-' + time.strftime('%Y%m%d-%H%M%S') + '.jsonl'
+
+
+def persist():
+    global tracefile
+    global tracedir
+    if tracefile is None or tracedir is None or not os.path.isdir(os.path.dirname(tracedir)):
+        return(None)
+    try:
+        if not os.path.isdir(tracedir):
+            os.makedirs(tracedir)
+        finalpath = os.path.join(tracedir, tracename)
+        if os.path.isfile(tracefile):
+            shutil.move(tracefile, finalpath)
+    except (IOError, OSError):
+        return(None)
+    tracefile = finalpath
+    tracedir = None
+    return(finalpath)
+
+
+def childenv():
+    if tracefile is None:
+        return({})
+    env = {'NTAP_TRACEFILE': tracefile}
+    if len(stack) > 0:
+        env['NTAP_TRACEPARENT'] = stack[-1]['id']
+    elif traceparent is not None:
+        env['NTAP_TRACEPARENT'] = traceparent
+    return(env)
+
+
+def begin(name):
+    span = {'name': name,
+            'id': newid(),
+            'pid': os.getpid(),
+            'start': time.time(),
+            'processes': 0,
+            'exitcodes': []}
+    if len(stack) > 0:
+        span['parent'] = stack[-1]['id']
+        span['depth'] = stack[-1]['depth'] + 1
+    else:
+        span['parent'] = traceparent
+        span['depth'] = 0
+    stack.append(span)
+    return(span)
+
+
+def end(**kwargs):
+    if len(stack) == 0:
+        return(None)
+    span = stack.pop()
+    span['end'] = time.time()
+    span['duration'] = round(span['end'] - span['start'], 3)
+    if 'status' in kwargs.keys():
+        span['status'] = kwargs['status']
+    elif len([code for code in span['exitcodes'] if code is not None and code > 0]) > 0:
+        span['status'] = 'error'
+    else:
+        span['status'] = 'ok'
+    completed.append(span)
+    writespan(span)
+    return(span)
+
+
+def writespan(span):
+    if tracefile is None:
+        return
+    try:
+        fh = open(tracefile, 'a')
+        fh.write(json.dumps(span, sort_keys=True) + "\n")
+        fh.close()
+    except IOError:
+        pass
+
+
+def recordprocess(command, result):
+    for span in stack:
+        span['processes'] += 1
+        span['exitcodes'].append(result)
+
+
+def summary():
+    spans = []
+    if tracefile is not None:
+        try:
+            for line in open(tracefile, 'r').read().splitlines():
+                spans.append(json.loads(line))
+        except (IOError, ValueError):
+            spans = list(completed)
+    else:
+        spans = list(completed)
+    children = {}
+    for item in spans:
+        children.setdefault(item.get('parent'), []).append(item)
+    lines = []
+
+    def render(parent, depth):
+        for item in sorted(children.get(parent, []), key=lambda x: x['start']):
+            label = '  ' * depth + str(item['name'])
+            detail = "%8.1fs %4d proc" % (item['duration'], item['processes'])
+            if not item['status'] == 'ok':
+                detail = detail + ' ' + str(item['status'])
+            lines.append(label[:44].ljust(44) + detail)
+            render(item['id'], depth + 1)
+
+    render(traceparent, 0)
+    return(lines)
+
+
+def closeall():
+    while len(stack) > 0:
+        end(status='exit')
+    persist()
+
+
+atexit.register(closeall)
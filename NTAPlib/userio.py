@@ -28,6 +28,8 @@ import sys
 import getopt
 import os
 import getpass
+import json
+import csv
 
 single = '1'
 multi = 'any'
@@ -325,38 +327,85 @@ def providenumber(maximum):
     return(answer)
 
 
-def grid(listoflists, **kwargs):
+def gridlines(listoflists, **kwargs):
     totalcolumns = len(listoflists[0])
-    totalrows = len(listoflists)
-    columnwidths = {}
-    for x in range(0, totalcolumns):
-        columnwidths[x] = len(listoflists[0][x])
-    for y in range(0, totalrows):
+    columnwidths = [0] * totalcolumns
+    for row in listoflists:
         for x in range(0, totalcolumns):
-            if listoflists[y][x] is not None and len(listoflists[y][x]) > columnwidths[x]:
-                columnwidths[x] = len(listoflists[y][x])
-    firstline = ''
-    secondline = ''
+            if row[x] is not None and len(row[x]) > columnwidths[x]:
+                columnwidths[x] = len(row[x])
+    lines = []
     if 'noheader' in kwargs.keys() and kwargs['noheader']:
-        for x in range(0, totalcolumns):
-            firstline = firstline + listoflists[0][x] + " " * (columnwidths[x] - len(listoflists[0][x]) + 1)
-        message(firstline.rstrip())
+        lines.append(' '.join([listoflists[0][x].ljust(columnwidths[x]) for x in range(0, totalcolumns)]).rstrip())
     else:
-        for x in range(0, totalcolumns):
-            firstline = firstline + listoflists[0][x].upper() + " " * (columnwidths[x] - len(listoflists[0][x]) + 1)
-            secondline = secondline + '-' * columnwidths[x] + " "
-        message(firstline.rstrip())
-        message(secondline.rstrip())
-    for y in range(1, totalrows):
-        nextline = ''
-        for x in range(0, totalcolumns):
-            if listoflists[y][x] is not None:
-                nextline = nextline + listoflists[y][x]
-            if listoflists[y][x] is None:
-                nextline = nextline + " " * (columnwidths[x] + 1)
-            else:
-                nextline = nextline + " " * (columnwidths[x] - len(listoflists[y][x]) + 1)
-        message(nextline.rstrip())
+        lines.append(' '.join([listoflists[0][x].upper().ljust(columnwidths[x]) for x in range(0, totalcolumns)]).rstrip())
+        lines.append(' '.join(['-' * width for width in columnwidths]).rstrip())
+    for row in listoflists[1:]:
+        lines.append(' '.join([(row[x] or '').ljust(columnwidths[x]) for x in range(0, totalcolumns)]).rstrip())
+    return(lines)
+
+
+def grid(listoflists, **kwargs):
+    sys.stdout.write("\n".join(gridlines(listoflists, **kwargs)) + "\n")
+    sys.stdout.flush()
+
+
+class GridScreen(object):
+    def __init__(self, **kwargs):
+        self.lines = None
+        self.kwargs = kwargs
+
+    def update(self, listoflists):
+        lines = gridlines(listoflists, **self.kwargs)
+        output = []
+        if self.lines is None:
+            output.append("\n".join(lines) + "\n")
+        elif len(lines) == len(self.lines):
+            for x in range(0, len(lines)):
+                if not lines[x] == self.lines[x]:
+                    distance = len(lines) - x
+                    output.append("\x1b[%dA\r\x1b[2K%s\r\x1b[%dB" % (distance, lines[x], distance))
+        else:
+            if len(self.lines) > 0:
+                output.append("\x1b[%dA\r" % len(self.lines))
+            output.append("\x1b[J" + "\n".join(lines) + "\n")
+        self.lines = lines
+        if len(output) > 0:
+            sys.stdout.write(''.join(output))
+            sys.stdout.flush()
+
+
+def rowoutput(columns, rows, **kwargs):
+    if 'output' in kwargs.keys():
+        output = kwargs['output']
+    else:
+        output = 'table'
+    if output == 'table':
+        table = [columns]
+        for row in rows:
+            table.append([row.get(key) for key in columns])
+        if len(table) > 1:
+            grid(table, **kwargs)
+    elif output == 'jsonl':
+        for row in rows:
+            sys.stdout.write(json.dumps(row, sort_keys=True) + "\n")
+            sys.stdout.flush()
+    elif output == 'json':
+        separator = "[\n"
+        for row in rows:
+            sys.stdout.write(separator + "  " + json.dumps(row, sort_keys=True))
+            separator = ",\n"
+        if separator == "[\n":
+            sys.stdout.write("[]\n")
+        else:
+            sys.stdout.write("\n]\n")
+        sys.stdout.flush()
+    elif output == 'csv':
+        writer = csv.writer(sys.stdout)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([unicode(row.get(key) or '').encode('utf-8') for key in columns])
+            sys.stdout.flush()
 
 
 def duration2seconds(value):